@@ -0,0 +1,299 @@
+"""
+Compact in-memory triple store for rdflib, for holding large RDF graphs.
+
+rdflib's default in-memory store keeps each triple in several dictionary-based
+indexes, which for large graphs costs far more memory than the terms themselves.
+This store interns each distinct RDF term to an integer id, and keeps triples
+as three parallel arrays of term ids, sorted in subject-predicate-object (SPO)
+order.  Two further arrays hold the triple positions in predicate-object-subject
+(POS) and object-subject-predicate (OSP) order, so that any triple pattern can
+be matched by a binary search in one of the three orderings.
+
+Triples added are appended to the arrays, and the sorted order and indexes are
+rebuilt when the store is next queried, so the store is best suited to graphs
+that are loaded and then queried, as when wrangling CALMA data.  If NumPy is
+available, the arrays are sorted without creating Python objects for each
+triple, so that rebuilding does not need more memory than the arrays themselves.
+
+Usage:
+
+    graph = rdflib.Graph(store=RDF_CompactStore())
+"""
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import array
+import threading
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from rdflib.store import Store
+
+# Logger for this module
+log = logging.getLogger(__name__)
+
+ID_TYPECODE = "i"       # Array type used for term ids and triple positions
+
+def _to_array(values):
+    """
+    Return array of term ids or triple positions from a NumPy array
+    """
+    a = array.array(ID_TYPECODE)
+    a.fromstring(values.astype(numpy.intc).tostring())
+    return a
+
+def _sort_triples_numpy(S, P, O):
+    """
+    Return triples from the supplied arrays of term ids in SPO order, without
+    duplicates, with positions of the sorted triples in POS and OSP order.
+    """
+    s     = numpy.frombuffer(S, dtype=numpy.intc)
+    p     = numpy.frombuffer(P, dtype=numpy.intc)
+    o     = numpy.frombuffer(O, dtype=numpy.intc)
+    order = numpy.lexsort((o, p, s))
+    s     = s[order]
+    p     = p[order]
+    o     = o[order]
+    order = None
+    keep  = numpy.ones(len(s), dtype=bool)
+    keep[1:] = (s[1:] != s[:-1]) | (p[1:] != p[:-1]) | (o[1:] != o[:-1])
+    s     = s[keep]
+    p     = p[keep]
+    o     = o[keep]
+    keep  = None
+    pos   = _to_array(numpy.lexsort((s, o, p)))
+    osp   = _to_array(numpy.lexsort((p, s, o)))
+    return (_to_array(s), _to_array(p), _to_array(o), pos, osp)
+
+def _sort_triples(S, P, O, n):
+    """
+    As _sort_triples_numpy, for use when NumPy is not available.  `n` is the
+    number of distinct term ids.
+    """
+    # Pack each triple into a single integer key for sorting
+    keys = sorted(set([ (S[i]*n + P[i])*n + O[i] for i in xrange(len(S)) ]))
+    s    = array.array(ID_TYPECODE)
+    p    = array.array(ID_TYPECODE)
+    o    = array.array(ID_TYPECODE)
+    for k in keys:
+        (sp, oi) = divmod(k, n)
+        (si, pi) = divmod(sp, n)
+        s.append(si)
+        p.append(pi)
+        o.append(oi)
+    keys = None
+    positions = xrange(len(s))
+    pos = array.array(ID_TYPECODE,
+        sorted(positions, key=lambda i: (p[i]*n + o[i])*n + s[i])
+        )
+    osp = array.array(ID_TYPECODE,
+        sorted(positions, key=lambda i: (o[i]*n + s[i])*n + p[i])
+        )
+    return (s, p, o, pos, osp)
+
+class RDF_CompactStore(Store):
+
+    """
+    rdflib store that holds triples as arrays of interned term ids.
+
+    All triples belong to a single graph: contexts are not distinguished, and
+    quoted (Notation3 formula) triples are not supported.  The store declares
+    itself context- and formula-aware only because rdflib's Turtle parser
+    requires this.
+    """
+
+    context_aware     = True
+    formula_aware     = True
+    transaction_aware = False
+    graph_aware       = False
+
+    def __init__(self, configuration=None, identifier=None):
+        super(RDF_CompactStore, self).__init__(configuration)
+        self.identifier = identifier
+        self._lock      = threading.RLock()
+        self._ids       = {}        # term -> id
+        self._terms     = []        # id -> term
+        self._s         = array.array(ID_TYPECODE)
+        self._p         = array.array(ID_TYPECODE)
+        self._o         = array.array(ID_TYPECODE)
+        self._pos       = array.array(ID_TYPECODE)
+        self._osp       = array.array(ID_TYPECODE)
+        self._indexed   = 0         # Number of triples sorted and indexed
+        self._prefixes  = {}        # namespace -> prefix
+        self._namespace = {}        # prefix -> namespace
+        return
+
+    def _intern(self, term):
+        """
+        Return id for term, allocating a new id if the term has not been seen
+        """
+        i = self._ids.get(term, None)
+        if i is None:
+            i = len(self._terms)
+            self._ids[term] = i
+            self._terms.append(term)
+        return i
+
+    def _build(self):
+        """
+        Sort triples added since the last query into SPO order, removing
+        duplicates, and rebuild the POS and OSP indexes.
+        """
+        with self._lock:
+            if self._indexed == len(self._s):
+                return
+            S, P, O = self._s, self._p, self._o
+            n       = len(self._terms)
+            # Drop the old indexes first, so they are not held while sorting
+            self._pos = None
+            self._osp = None
+            if numpy is not None and len(S) > 0:
+                (s, p, o, pos, osp) = _sort_triples_numpy(S, P, O)
+            else:
+                (s, p, o, pos, osp) = _sort_triples(S, P, O, n)
+            (self._s, self._p, self._o, self._pos, self._osp) = (s, p, o, pos, osp)
+            self._indexed = len(s)
+            log.debug("RDF_CompactStore._build: %d triples, %d terms"%(len(s), n))
+        return
+
+    def _range(self, index, cols, key):
+        """
+        Return range of positions in an index for which the leading columns match
+        the supplied key values.
+
+        index   array of triple positions in index order, or None for SPO order.
+        cols    sequence of column arrays, in index order.
+        key     tuple of term ids for the leading columns.
+        """
+        cols  = cols[:len(key)]
+        def value(pos):
+            i = index[pos] if index is not None else pos
+            return tuple([ c[i] for c in cols ])
+        lo, hi = 0, self._indexed
+        while lo < hi:
+            mid = (lo+hi)//2
+            if value(mid) < key:
+                lo = mid+1
+            else:
+                hi = mid
+        start = lo
+        hi    = self._indexed
+        while lo < hi:
+            mid = (lo+hi)//2
+            if value(mid) <= key:
+                lo = mid+1
+            else:
+                hi = mid
+        return (start, lo)
+
+    def _match(self, pattern):
+        """
+        Return iterator over positions of triples matching a pattern of term ids,
+        where None matches any term.
+        """
+        (si, pi, oi) = pattern
+        S, P, O      = self._s, self._p, self._o
+        if si is not None:
+            if oi is not None and pi is None:
+                index, cols, key = (self._osp, (O, S), (oi, si))
+            else:
+                index, cols, key = (None, (S, P, O), tuple([ i for i in pattern if i is not None ]))
+        elif pi is not None:
+            index, cols, key = (self._pos, (P, O), (pi, oi) if oi is not None else (pi,))
+        elif oi is not None:
+            index, cols, key = (self._osp, (O,), (oi,))
+        else:
+            return xrange(self._indexed)
+        (start, end) = self._range(index, cols, key)
+        if index is None:
+            return xrange(start, end)
+        return index[start:end]
+
+    # Store interface
+
+    def add(self, (subject, predicate, object), context, quoted=False):
+        if quoted:
+            raise ValueError("RDF_CompactStore does not support quoted triples")
+        with self._lock:
+            self._s.append(self._intern(subject))
+            self._p.append(self._intern(predicate))
+            self._o.append(self._intern(object))
+        return
+
+    def addN(self, quads):
+        with self._lock:
+            for (s, p, o, c) in quads:
+                self._s.append(self._intern(s))
+                self._p.append(self._intern(p))
+                self._o.append(self._intern(o))
+        return
+
+    def remove(self, (subject, predicate, object), context=None):
+        with self._lock:
+            self._build()
+            pattern = [ self._ids.get(t, -1) if t is not None else None
+                        for t in (subject, predicate, object) ]
+            if -1 in pattern:
+                return
+            removed = set(self._match(pattern))
+            if not removed:
+                return
+            keep = [ i for i in xrange(self._indexed) if i not in removed ]
+            self._s = array.array(ID_TYPECODE, [ self._s[i] for i in keep ])
+            self._p = array.array(ID_TYPECODE, [ self._p[i] for i in keep ])
+            self._o = array.array(ID_TYPECODE, [ self._o[i] for i in keep ])
+            self._indexed = 0
+            self._build()
+        return
+
+    def triples(self, (subject, predicate, object), context=None):
+        with self._lock:
+            self._build()
+            pattern = [ self._ids.get(t, -1) if t is not None else None
+                        for t in (subject, predicate, object) ]
+            if -1 in pattern:
+                return
+            S, P, O = self._s, self._p, self._o
+            terms   = self._terms
+            matches = self._match(pattern)
+        for i in matches:
+            yield ((terms[S[i]], terms[P[i]], terms[O[i]]), iter(()))
+        return
+
+    def __len__(self, context=None):
+        self._build()
+        return self._indexed
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace):
+        self._prefixes[namespace] = prefix
+        self._namespace[prefix]   = namespace
+        return
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix, None)
+
+    def prefix(self, namespace):
+        return self._prefixes.get(namespace, None)
+
+    def namespaces(self):
+        for prefix, namespace in self._namespace.iteritems():
+            yield prefix, namespace
+        return
+
+    def stats(self):
+        """
+        Return dictionary of store size counts
+        """
+        self._build()
+        return { "triples": self._indexed, "terms": len(self._terms) }
+
+# End.
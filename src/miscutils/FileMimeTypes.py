@@ -62,6 +62,7 @@ FileMimeTypes = (
     , ("application/mp4",                       ("mp4s",))
     , ("application/msword",                    ("doc","dot",))
     , ("application/mxf",                       ("mxf",))
+    , ("application/n-triples",                 ("nt",))
     , ("application/octet-stream",              ("bin","dms","lrf","mar","so","dist","distz","pkg","bpk","dump","elc","deploy",))
     , ("application/oda",                       ("oda",))
     , ("application/oebps-package+xml",         ("opf",))
@@ -374,3 +375,12 @@ FileMimeTypes = (
     , ("video/x-smv",                           ("smv",))
     , ("x-conference/x-cooltalk",               ("ice",))
     })
+
+# Content encodings indicated by a final filename extension, as in "analysis.ttl.gz".
+# (A file with just an encoding extension, like "data.bz2", is treated according to
+# FileMimeTypes above.)
+
+FileContentEncodings = (
+    { ("gzip",                                  ("gz",))
+    , ("bzip2",                                 ("bz2",))
+    })
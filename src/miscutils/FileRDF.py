@@ -0,0 +1,172 @@
+"""
+Read RDF from local files, as an alternative to HTTP_Session.doRequestRDF.
+
+Files are read using memory-mapped I/O, and parsed according to a content type
+determined from the filename extension.  Compressed files, indicated by a
+compound extension such as ".ttl.gz", ".ttl.bz2" or ".nt.gz", are decompressed
+as they are read by the parser.  Results are returned using the same
+(status, reason, graph) contract as HttpSessionRDF.parseRDFResponse, with a
+fake 404 status if the file cannot be read, so that callers can treat local
+files and HTTP resources alike.
+
+Usage:
+
+    (status, reason, graph) = readRDFFile(filename, baseuri)
+"""
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import bz2
+import gzip
+import mmap
+import rdflib
+import logging
+
+from FileMimeTypes  import FileMimeTypes, FileContentEncodings
+from HttpSessionRDF import RDF_CONTENT_TYPES, parseRDFStream
+
+# Logger for this module
+log = logging.getLogger(__name__)
+
+FileType_MimeType = dict([ (ft,ct) for (ct, fts) in FileMimeTypes
+                                   for ft in fts ])
+
+FileType_Encoding = dict([ (ft,ce) for (ce, fts) in FileContentEncodings
+                                   for ft in fts ])
+
+def fileContentTypeEncoding(filename):
+    """
+    Helper function returns content type and content encoding (or None) for a
+    filename, based on its extension or compound extension (e.g. ".ttl.gz")
+    """
+    fsplit = filename.rsplit(".", 2)
+    if ( len(fsplit) == 3 and fsplit[2] in FileType_Encoding and
+         fsplit[1] in FileType_MimeType ):
+        return (FileType_MimeType[fsplit[1]], FileType_Encoding[fsplit[2]])
+    if len(fsplit) >= 2 and fsplit[-1] in FileType_MimeType:
+        return (FileType_MimeType[fsplit[-1]], None)
+    return ("application/octet-stream", None)
+
+def fileContentType(filename):
+    """
+    Helper function returns content type for a filename, based on its extension
+    """
+    return fileContentTypeEncoding(filename)[0]
+
+def openFile(filename, encoding=None):
+    """
+    Helper function opens a file for reading, returning a file-like object that
+    decompresses the content as it is read if a content encoding is indicated.
+    """
+    if encoding == "gzip":
+        return gzip.GzipFile(filename, "rb")
+    if encoding == "bzip2":
+        return bz2.BZ2File(filename, "rb")
+    return MappedFile(filename)
+
+
+class MappedFile(object):
+
+    """
+    Read-only file-like object for a memory-mapped file, as used by RDF parsers
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # Empty files cannot be mapped
+        self._map  = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def read(self, size=-1):
+        if self._map is None:
+            return ""
+        if size < 0:
+            size = len(self._map) - self._map.tell()
+        return self._map.read(size)
+
+    def readline(self, size=-1):
+        if self._map is None:
+            return ""
+        return self._map.readline()
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+        return
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        return
+
+def readRDFFile(filename, baseuri, graph=None, graphcache=None):
+    """
+    Read and parse RDF from a local file.
+
+    filename    name of file to read.
+    baseuri     base URI used when parsing the file content.
+    graph       an rdflib.Graph object to which any RDF read is added.  If not
+                provided, a new RDF graph is created and returned.
+    graphcache  if supplied, a parsed-graph cache (see GraphCache); the file's
+                size and modification time are used to identify its version.
+
+    Returns status, reason(text), response graph or None
+    """
+    try:
+        st = os.stat(filename)
+    except OSError as e:
+        return (404, "File not found: %s"%(e.strerror), None)
+    (content_type, encoding) = fileContentTypeEncoding(filename)
+    if content_type not in RDF_CONTENT_TYPES:
+        return (901, "Non-RDF file type", None)
+    bodyformat = RDF_CONTENT_TYPES[content_type]
+    rdfgraph   = graph if graph != None else rdflib.graph.Graph()
+    try:
+        if graphcache:
+            cachekey = graphcache.key(
+                baseuri, {"last-modified": "%d:%d"%(st.st_mtime, st.st_size)}, None
+                )
+            if graphcache.load(cachekey, rdfgraph):
+                return (200, "OK", rdfgraph)
+            docgraph = rdflib.graph.Graph()
+            parseFile(filename, encoding, baseuri, docgraph, bodyformat)
+            graphcache.save(cachekey, docgraph)
+            for prefix, namespace in docgraph.namespaces():
+                rdfgraph.bind(prefix, namespace, override=True)
+            rdfgraph += docgraph
+        else:
+            parseFile(filename, encoding, baseuri, rdfgraph, bodyformat)
+    except IOError as e:
+        return (404, "File not readable: %s"%(e.strerror or e), None)
+    except Exception as e:
+        log.info("readRDFFile: %s: %s"%(filename, e))
+        return (902, "RDF (%s) parse failure"%bodyformat, None)
+    return (200, "OK", rdfgraph)
+
+def parseFile(filename, encoding, baseuri, graph, bodyformat):
+    """
+    Helper function parses RDF from a file into the supplied graph
+    """
+    stream = openFile(filename, encoding)
+    try:
+        parseRDFStream(graph, stream, baseuri, bodyformat)
+    finally:
+        stream.close()
+    return graph
+
+# End.
@@ -0,0 +1,207 @@
+"""
+On-disk cache of parsed RDF documents.
+
+Parsing Turtle with rdflib is slow compared with the cost of reading a local
+copy of the document, so this cache keeps the triples from each parsed document
+in a compact binary form (Python marshal format), keyed by document URI and a
+validator for the document version (ETag, Last-Modified, or a hash of the
+document content).  When a document is seen again with the same validator, its
+triples are bulk-loaded into the target graph instead of being re-parsed.
+
+Usage:
+
+    graphcache = RDF_GraphCache(cachedir)
+    key        = graphcache.key(uri, headers, data)
+    if not graphcache.load(key, graph):
+        g = rdflib.graph.Graph()
+        g.parse(data=data, publicID=uri, format=bodyformat)
+        graphcache.save(key, g)
+        ...
+"""
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import array
+import marshal
+import hashlib
+import threading
+import logging
+
+from rdflib import URIRef, BNode, Literal
+
+# Logger for this module
+log = logging.getLogger(__name__)
+
+GRAPH_CACHE_FORMAT = 1
+
+def termToTuple(term):
+    """
+    Helper function returns a tuple of marshallable values for an RDF term
+    """
+    if isinstance(term, URIRef):
+        return ("U", unicode(term))
+    if isinstance(term, BNode):
+        return ("B", unicode(term))
+    return (
+        "L", unicode(term),
+        unicode(term.datatype) if term.datatype else None,
+        term.language
+        )
+
+def tupleToTerm(t, bnodes):
+    """
+    Helper function returns an RDF term for a tuple returned by termToTuple.
+
+    bnodes is a dictionary used to map blank node identifiers from the cached
+    document to new blank nodes, so that each load of a document has distinct
+    blank nodes, as it would if the document were re-parsed.
+    """
+    if t[0] == "U":
+        return URIRef(t[1])
+    if t[0] == "B":
+        if t[1] not in bnodes:
+            bnodes[t[1]] = BNode()
+        return bnodes[t[1]]
+    return Literal(t[1], datatype=t[2], lang=t[3])
+
+
+class RDF_GraphCache(object):
+
+    """
+    Cache of parsed RDF documents.
+
+    cachedir        directory in which parsed documents are saved.
+    """
+
+    def __init__(self, cachedir):
+        self._cachedir = cachedir
+        self._lock     = threading.Lock()
+        self._counts   = { "hits": 0, "misses": 0 }
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        return
+
+    def cachedir(self):
+        return self._cachedir
+
+    def _count(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+        return
+
+    def _cachefile(self, key):
+        return os.path.join(self._cachedir, key+".graph")
+
+    def key(self, uri, headers, data):
+        """
+        Return cache key for a document, using the ETag or Last-Modified value
+        from the supplied response headers if present, or a hash of the document
+        content.
+        """
+        if headers.get("etag", None):
+            validator = "etag:"+headers["etag"]
+        elif headers.get("last-modified", None):
+            validator = "modified:"+headers["last-modified"]
+        else:
+            validator = "sha1:"+hashlib.sha1(data).hexdigest()
+        return hashlib.sha1("%s\n%s"%(uri, validator)).hexdigest()
+
+    def save(self, key, graph):
+        """
+        Save triples and namespace bindings from the supplied graph.
+        """
+        termindex = {}
+        terms     = []
+        triples   = array.array("i")
+        for spo in graph:
+            for term in spo:
+                if term not in termindex:
+                    termindex[term] = len(terms)
+                    terms.append(termToTuple(term))
+                triples.append(termindex[term])
+        namespaces = [ (unicode(p), unicode(n)) for (p, n) in graph.namespaces() ]
+        cachedata  = marshal.dumps(
+            (GRAPH_CACHE_FORMAT, namespaces, terms, triples.tostring())
+            )
+        filename = self._cachefile(key)
+        tmpname  = "%s.%d.%d.tmp"%(filename, os.getpid(), threading.current_thread().ident)
+        with open(tmpname, "wb") as f:
+            f.write(cachedata)
+        os.rename(tmpname, filename)
+        return
+
+    def load(self, key, graph):
+        """
+        Add cached triples and namespace bindings to the supplied graph.
+
+        Returns True if the document was found in the cache, otherwise False.
+        """
+        try:
+            with open(self._cachefile(key), "rb") as f:
+                (fmt, namespaces, terms, tripledata) = marshal.loads(f.read())
+        except (IOError, EOFError, ValueError, TypeError):
+            self._count("misses")
+            return False
+        if fmt != GRAPH_CACHE_FORMAT:
+            self._count("misses")
+            return False
+        bnodes  = {}
+        nodes   = [ tupleToTerm(t, bnodes) for t in terms ]
+        triples = array.array("i")
+        triples.fromstring(tripledata)
+        for prefix, namespace in namespaces:
+            graph.bind(prefix, namespace, override=True)
+        graph.addN(
+            (nodes[triples[i]], nodes[triples[i+1]], nodes[triples[i+2]], graph)
+            for i in xrange(0, len(triples), 3)
+            )
+        self._count("hits")
+        return True
+
+    def stats(self):
+        """
+        Return dictionary of cache usage counts
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def merge_stats(self, counts):
+        """
+        Add usage counts from another process using the same cache (e.g. a worker
+        process), so that they are included in this process's report.
+        """
+        with self._lock:
+            for counter, n in counts.items():
+                self._counts[counter] = self._counts.get(counter, 0) + n
+        return
+
+    def report(self):
+        """
+        Return cache usage summary as a string
+        """
+        return (
+            "RDF graph cache %(cachedir)s: %(hits)d hits, %(misses)d misses"
+            )%dict(self.stats(), cachedir=self._cachedir)
+
+# Process-wide default cache
+
+_default_graphcache = None
+
+def get_default_graphcache():
+    """
+    Return the process-wide default parsed-graph cache, or None
+    """
+    return _default_graphcache
+
+def set_default_graphcache(graphcache):
+    """
+    Set the process-wide default parsed-graph cache used by HTTP_Session
+    """
+    global _default_graphcache
+    _default_graphcache = graphcache
+    return graphcache
+
+# End.
@@ -0,0 +1,335 @@
+"""
+Event-driven HTTP fetch engine, as an alternative to blocking HTTP_Session requests.
+
+All requests are handled on the calling thread by a single asyncore event loop,
+so that very large numbers of requests can be in flight at once without a thread
+per request.  The number of concurrent connections to any one host is capped, and
+further requests for that host are queued until a connection slot is free.
+
+Responses are returned using the same (status, reason, headers, data) contract as
+HTTP_Session.doRequest, and RDF responses are parsed using the same content type
+handling as HTTP_Session.doRequestRDFFollowRedirect.
+
+Usage:
+
+    fetcher = HTTP_AsyncFetcher(max_per_host=8)
+    results = fetcher.fetchRDF(uris)
+    for uri in uris:
+        (status, reason, headers, finaluri, graph) = results[uri]
+
+Only "http:" URIs are supported; requests for other schemes complete immediately
+with a fake 900 status.
+"""
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import sys
+import time
+import socket
+import asyncore
+import urlparse
+import collections
+import logging
+
+from HttpSessionRDF import ACCEPT_RDF_CONTENT_TYPES, parseRDFResponse
+from GraphCache     import get_default_graphcache
+
+# Logger for this module
+log = logging.getLogger(__name__)
+
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+def decodeChunked(body):
+    """
+    Helper function decodes an HTTP/1.1 chunked transfer-coded response body
+    """
+    result = []
+    cursor = 0
+    while cursor < len(body):
+        eol = body.find("\r\n", cursor)
+        if eol < 0:
+            break
+        size = int(body[cursor:eol].split(";",1)[0].strip() or "0", 16)
+        if size == 0:
+            break
+        result.append(body[eol+2:eol+2+size])
+        cursor = eol+2+size+2
+    return "".join(result)
+
+def parseResponse(response):
+    """
+    Helper function to parse a complete HTTP response message.
+
+    Returns status, reason(text), response headers, response body
+    """
+    head, sep, body = response.partition("\r\n\r\n")
+    if not sep:
+        return (900, "Incomplete HTTP response", {"_headerlist": []}, None)
+    lines      = head.split("\r\n")
+    statusline = lines[0].split(" ", 2)
+    try:
+        status = int(statusline[1])
+    except (IndexError, ValueError):
+        return (900, "Invalid HTTP status line: %r"%lines[0], {"_headerlist": []}, None)
+    reason     = statusline[2] if len(statusline) > 2 else ""
+    headerlist = []
+    for line in lines[1:]:
+        if line[:1] in " \t" and headerlist:
+            # Continuation line
+            hn, hv = headerlist[-1]
+            headerlist[-1] = (hn, hv+" "+line.strip())
+        else:
+            hn, _, hv = line.partition(":")
+            headerlist.append((hn.strip().lower(), hv.strip()))
+    headers = dict(headerlist)   # dict(...) keeps last result of multiple keys
+    headers["_headerlist"] = headerlist
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = decodeChunked(body)
+    elif "content-length" in headers:
+        body = body[:int(headers["content-length"])]
+    return (status, reason, headers, body)
+
+
+class HTTP_AsyncRequest(object):
+
+    """
+    Details of a single request handled by HTTP_AsyncFetcher.
+
+    When the request completes, `result` is set to a tuple
+    (status, reason, headers, data).
+    """
+
+    def __init__(self, uri, accept=None, reqheaders=None, callback=None):
+        self.uri        = uri
+        self.accept     = accept
+        self.reqheaders = reqheaders or {}
+        self.callback   = callback
+        self.redirects  = 0
+        self.started    = None
+        self.result     = None
+        return
+
+    def host(self):
+        return urlparse.urlsplit(self.uri).netloc
+
+
+class _HTTP_AsyncConnection(asyncore.dispatcher):
+
+    """
+    asyncore dispatcher for a single HTTP request/response exchange.
+
+    Each connection is used for a single request (Connection: close), and the
+    response body is read until the server closes the connection.
+    """
+
+    def __init__(self, fetcher, req, address):
+        asyncore.dispatcher.__init__(self, map=fetcher._map)
+        self._fetcher  = fetcher
+        self._req      = req
+        self._inbuf    = []
+        self._done     = False
+        uriparts       = urlparse.urlsplit(req.uri)
+        path           = uriparts.path or "/"
+        if uriparts.query: path += ("?"+uriparts.query)
+        reqheaders     = { "host": uriparts.netloc, "connection": "close" }
+        if req.accept:
+            reqheaders["accept"] = req.accept
+        reqheaders.update(req.reqheaders)
+        self._outbuf   = (
+            "GET %s HTTP/1.1\r\n"%path +
+            "".join([ "%s: %s\r\n"%(hn, hv) for (hn, hv) in reqheaders.items() ]) +
+            "\r\n"
+            )
+        log.debug("_HTTP_AsyncConnection: GET %s"%(req.uri))
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect(address)
+        return
+
+    def writable(self):
+        return len(self._outbuf) > 0
+
+    def handle_connect(self):
+        return
+
+    def handle_write(self):
+        sent = self.send(self._outbuf)
+        self._outbuf = self._outbuf[sent:]
+        return
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if data:
+            self._inbuf.append(data)
+        return
+
+    def handle_close(self):
+        self.finish(parseResponse("".join(self._inbuf)))
+        return
+
+    def handle_error(self):
+        e = sys.exc_info()[1]
+        log.warn("HTTP_AsyncFetcher error %r accessing %s"%(e, self._req.uri))
+        self.finish((900, str(e), {"_headerlist": []}, None))
+        return
+
+    def finish(self, result):
+        if not self._done:
+            self._done = True
+            self.close()
+            self._fetcher._complete(self._req, result)
+        return
+
+
+class HTTP_AsyncFetcher(object):
+
+    """
+    Single-threaded fetch engine for many concurrent HTTP GET requests.
+
+    max_per_host    maximum number of concurrent connections to any one host.
+    max_in_flight   maximum number of concurrent connections overall.
+    timeout         number of seconds after which an incomplete request is
+                    abandoned with a fake 900 status.
+    max_redirects   maximum number of redirects followed for a request.
+    """
+
+    def __init__(self, max_per_host=8, max_in_flight=1000, timeout=60.0, max_redirects=5):
+        self._max_per_host  = max_per_host
+        self._max_in_flight = max_in_flight
+        self._timeout       = timeout
+        self._max_redirects = max_redirects
+        self._map           = {}
+        self._pending       = collections.OrderedDict()     # host -> deque of requests
+        self._active        = {}                            # host -> count
+        self._connections   = {}                            # request -> connection
+        self._addresses     = {}                            # host -> (ipaddr, port)
+        return
+
+    def submit(self, uri, accept=None, reqheaders=None, callback=None):
+        """
+        Queue a GET request for the indicated URI.
+
+        uri         absolute URI of resource to retrieve
+        accept      string containing list of content types for HTTP accept header
+        reqheaders  dictionary of additional header fields to send with the HTTP request
+        callback    function called with the request object when the request completes
+
+        Returns an HTTP_AsyncRequest object whose `result` is set when the request
+        completes.
+        """
+        req = HTTP_AsyncRequest(str(uri), accept=accept, reqheaders=reqheaders, callback=callback)
+        self._enqueue(req)
+        return req
+
+    def _enqueue(self, req):
+        self._pending.setdefault(req.host(), collections.deque()).append(req)
+        return
+
+    def _resolve(self, req):
+        uriparts = urlparse.urlsplit(req.uri)
+        if uriparts.netloc not in self._addresses:
+            host = uriparts.hostname
+            port = uriparts.port or 80
+            self._addresses[uriparts.netloc] = (socket.gethostbyname(host), port)
+        return self._addresses[uriparts.netloc]
+
+    def _start(self, req):
+        if urlparse.urlsplit(req.uri).scheme != "http":
+            self._complete(req, (900, "Unsupported URI scheme", {"_headerlist": []}, None))
+            return
+        host = req.host()
+        try:
+            address = self._resolve(req)
+        except socket.error, e:
+            self._complete(req, (900, str(e), {"_headerlist": []}, None))
+            return
+        self._active[host]      = self._active.get(host, 0) + 1
+        req.started             = time.time()
+        self._connections[req]  = _HTTP_AsyncConnection(self, req, address)
+        return
+
+    def _start_pending(self):
+        for host in list(self._pending.keys()):
+            queue = self._pending[host]
+            while ( queue and
+                    self._active.get(host, 0) < self._max_per_host and
+                    len(self._connections) < self._max_in_flight ):
+                self._start(queue.popleft())
+            if not queue:
+                del self._pending[host]
+        return
+
+    def _complete(self, req, result):
+        if req in self._connections:
+            del self._connections[req]
+            self._active[req.host()] -= 1
+        (status, reason, headers, data) = result
+        if ( status in REDIRECT_STATUS and "location" in headers and
+             req.redirects < self._max_redirects ):
+            req.uri        = urlparse.urljoin(req.uri, headers["location"])
+            req.redirects += 1
+            self._enqueue(req)
+            return
+        headers.setdefault("content-location", req.uri)
+        log.debug("HTTP_AsyncFetcher response: %03d %s (%s)"%(status, reason, req.uri))
+        req.result = result
+        if req.callback:
+            req.callback(req)
+        return
+
+    def _check_timeouts(self):
+        now = time.time()
+        for req, conn in self._connections.items():
+            if now - req.started > self._timeout:
+                conn.finish((900, "Request timed out", {"_headerlist": []}, None))
+        return
+
+    def run(self):
+        """
+        Run the event loop until all submitted requests have completed.
+        """
+        while self._pending or self._connections:
+            self._start_pending()
+            if self._map:
+                asyncore.loop(timeout=0.1, map=self._map, count=1)
+            self._check_timeouts()
+        return
+
+    def fetch(self, uris, accept=None, reqheaders=None):
+        """
+        Retrieve all of the supplied URIs.
+
+        Returns a dictionary keyed by URI of (status, reason, headers, data) tuples.
+        """
+        reqs = [ self.submit(u, accept=accept, reqheaders=reqheaders) for u in uris ]
+        self.run()
+        return dict([ (str(u), r.result) for (u, r) in zip(uris, reqs) ])
+
+    def fetchRDF(self, uris, reqheaders=None, graph=None):
+        """
+        Retrieve all of the supplied URIs as RDF.
+
+        If `graph` is supplied, all RDF retrieved is added to it, in the order
+        the URIs are supplied; otherwise each URI is parsed to a new graph.
+
+        Responses may be gzip-compressed, in which case they are decompressed
+        as they are parsed.
+
+        Returns a dictionary keyed by URI of
+        (status, reason, headers, final URI, response graph or body) tuples.
+        """
+        rdfreqheaders = { "accept-encoding": "gzip" }
+        rdfreqheaders.update(reqheaders or {})
+        responses = self.fetch(uris, accept=ACCEPT_RDF_CONTENT_TYPES, reqheaders=rdfreqheaders)
+        results   = {}
+        for u in uris:
+            (status, reason, headers, data) = responses[str(u)]
+            (status, reason, data) = parseRDFResponse(
+                status, reason, headers, data, str(u),
+                graph=graph, graphcache=get_default_graphcache()
+                )
+            results[str(u)] = (status, reason, headers, headers["content-location"], data)
+        return results
+
+# End.
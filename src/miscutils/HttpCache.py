@@ -0,0 +1,244 @@
+"""
+Persistent on-disk cache of HTTP GET responses, with conditional revalidation.
+
+Each cached response is stored as two files in the cache directory, named using
+a hash of the request URI and accept header: a ".body" file containing the
+response body, and a ".json" file containing the response status, headers and
+validators (ETag and Last-Modified values).
+
+When a cached response is available, requests are issued as conditional GETs
+(If-None-Match / If-Modified-Since), and a "304 Not Modified" response is
+satisfied from the cache.  Optionally, responses less than "max_age" seconds
+old are returned from the cache without contacting the server at all.
+
+Usage:
+
+    cache = HTTP_Cache(cachedir)
+    set_default_cache(cache)        # Use for all HTTP_Session requests
+    ...
+    print(cache.report())
+"""
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import time
+import json
+import hashlib
+import threading
+import logging
+
+# Logger for this module
+log = logging.getLogger(__name__)
+
+class HTTP_CacheEntry(object):
+
+    """
+    A cached HTTP response, as read from the cache directory.
+    """
+
+    def __init__(self, cache, key, meta):
+        self._cache   = cache
+        self.key      = key
+        self.uri      = meta["uri"]
+        self.status   = meta["status"]
+        self.reason   = meta["reason"]
+        self.headers  = dict(meta["headerlist"])
+        self.headers["_headerlist"] = [ tuple(h) for h in meta["headerlist"] ]
+        self.stored   = meta["stored"]
+        self.etag     = self.headers.get("etag", None)
+        self.modified = self.headers.get("last-modified", None)
+        return
+
+    def data(self):
+        """
+        Return cached response body
+        """
+        with open(self._cache._bodyfile(self.key), "rb") as f:
+            return f.read()
+
+    def conditional_headers(self):
+        """
+        Return dictionary of request headers for revalidating this cache entry
+        """
+        reqheaders = {}
+        if self.etag:
+            reqheaders["if-none-match"] = self.etag
+        if self.modified:
+            reqheaders["if-modified-since"] = self.modified
+        return reqheaders
+
+
+class HTTP_Cache(object):
+
+    """
+    On-disk HTTP response cache.
+
+    cachedir        directory in which cached responses are saved.
+    max_age         number of seconds for which a cached response is used without
+                    revalidation.  The default value, 0, means that all cached
+                    responses are revalidated with the server before use.
+    """
+
+    def __init__(self, cachedir, max_age=0):
+        self._cachedir = cachedir
+        self._max_age  = max_age
+        self._lock     = threading.Lock()
+        self._counts   = { "hits": 0, "revalidated": 0, "updated": 0, "misses": 0 }
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        return
+
+    def cachedir(self):
+        return self._cachedir
+
+    def _key(self, uri, accept):
+        return hashlib.sha1("%s\n%s"%(uri, accept or "")).hexdigest()
+
+    def _metafile(self, key):
+        return os.path.join(self._cachedir, key+".json")
+
+    def _bodyfile(self, key):
+        return os.path.join(self._cachedir, key+".body")
+
+    def _count(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+        return
+
+    def _write(self, filename, data):
+        # Write to temporary file and rename, so concurrent readers never see
+        # a partially written file.
+        tmpname = "%s.%d.%d.tmp"%(filename, os.getpid(), threading.current_thread().ident)
+        with open(tmpname, "wb") as f:
+            f.write(data)
+        os.rename(tmpname, filename)
+        return
+
+    def lookup(self, uri, accept=None):
+        """
+        Return cache entry for the indicated URI and accept header, or None.
+        """
+        key = self._key(uri, accept)
+        try:
+            with open(self._metafile(key), "rb") as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if not os.path.exists(self._bodyfile(key)):
+            return None
+        return HTTP_CacheEntry(self, key, meta)
+
+    def is_fresh(self, entry):
+        """
+        Return True if the cache entry may be used without revalidation.
+        """
+        return (time.time() - entry.stored) < self._max_age
+
+    def store(self, uri, accept, status, reason, headers, data):
+        """
+        Save response in cache, and return the corresponding cache entry.
+        """
+        key        = self._key(uri, accept)
+        headerlist = [ (hn, hv) for (hn, hv) in headers["_headerlist"] ]
+        meta       = (
+            { "uri":        uri
+            , "status":     status
+            , "reason":     reason
+            , "headerlist": headerlist
+            , "stored":     time.time()
+            })
+        self._write(self._bodyfile(key), data)
+        self._write(self._metafile(key), json.dumps(meta, indent=2))
+        return HTTP_CacheEntry(self, key, meta)
+
+    def touch(self, entry):
+        """
+        Note that a cache entry has been revalidated by the server.
+        """
+        with open(self._metafile(entry.key), "rb") as f:
+            meta = json.load(f)
+        meta["stored"] = time.time()
+        self._write(self._metafile(entry.key), json.dumps(meta, indent=2))
+        return
+
+    def request(self, uri, accept, do_request):
+        """
+        Perform a GET request via the cache.
+
+        uri         URI of resource to retrieve
+        accept      accept header value used for the request
+        do_request  function called with a dictionary of additional request
+                    headers to perform the HTTP request, returning
+                    (status, reason, headers, data)
+
+        Returns (status, reason, headers, data), either from the server or
+        from the cache.
+        """
+        entry = self.lookup(uri, accept)
+        if entry is None:
+            self._count("misses")
+            (status, reason, headers, data) = do_request({})
+        elif self.is_fresh(entry):
+            self._count("hits")
+            return (entry.status, entry.reason, entry.headers, entry.data())
+        else:
+            (status, reason, headers, data) = do_request(entry.conditional_headers())
+            if status == 304:
+                log.debug("HTTP_Cache.request: revalidated %s"%(uri))
+                self._count("revalidated")
+                self.touch(entry)
+                return (entry.status, entry.reason, entry.headers, entry.data())
+            self._count("updated")
+        if status == 200 and data is not None:
+            self.store(uri, accept, status, reason, headers, data)
+        return (status, reason, headers, data)
+
+    def stats(self):
+        """
+        Return dictionary of cache usage counts
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def merge_stats(self, counts):
+        """
+        Add usage counts from another process using the same cache (e.g. a worker
+        process), so that they are included in this process's report.
+        """
+        with self._lock:
+            for counter, n in counts.items():
+                self._counts[counter] = self._counts.get(counter, 0) + n
+        return
+
+    def report(self):
+        """
+        Return cache usage summary as a string
+        """
+        counts = self.stats()
+        return (
+            "HTTP cache %(cachedir)s: %(hits)d hits, %(revalidated)d revalidated, "
+            "%(updated)d updated, %(misses)d misses"
+            )%dict(counts, cachedir=self._cachedir)
+
+# Process-wide default cache
+
+_default_cache = None
+
+def get_default_cache():
+    """
+    Return the process-wide default HTTP cache, or None
+    """
+    return _default_cache
+
+def set_default_cache(cache):
+    """
+    Set the process-wide default HTTP cache used by HTTP_Session
+    """
+    global _default_cache
+    _default_cache = cache
+    return cache
+
+# End.
@@ -0,0 +1,234 @@
+"""
+Process-wide pool of keep-alive HTTP connections.
+
+httplib2.Http objects hold open connections to each host they have accessed,
+but they are not safe for use by more than one thread at a time.  This module
+keeps a pool of such objects for each scheme/host, so that any number of
+HTTP_Session objects (in any number of threads) can reuse connections that
+were opened by earlier requests, rather than paying for a new TCP (and TLS)
+connection setup on every request.
+
+Pooled connections must not cross a fork: a child process (e.g. a
+multiprocessing worker) that used idle connections inherited from its parent
+would share their sockets with the parent and with any other child, and could
+read responses meant for another process.  The pool records the process that
+owns its connections, and a pool used in a new process discards (without
+closing) any connections it inherited before handing out connections of its own.
+
+Usage:
+
+    pool = get_connection_pool()
+    with pool.connection(scheme, host) as http2:
+        (resp, data) = http2.request(uri, ...)
+"""
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import time
+import threading
+import contextlib
+import httplib2
+import logging
+
+# Logger for this module
+log = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE    = 8        # Idle connections retained per host
+DEFAULT_IDLE_TIMEOUT = 30.0     # Seconds an idle connection is retained
+
+def close_http(http2):
+    """
+    Close any connections held open by an httplib2.Http object
+    """
+    for conn in http2.connections.values():
+        try:
+            conn.close()
+        except Exception, e:
+            log.debug("close_http: %r"%(e,))
+    http2.connections.clear()
+    return
+
+
+class HTTP_ConnectionPool(object):
+
+    """
+    Thread-safe pool of httplib2.Http objects, keyed by URI scheme and host.
+
+    maxsize         maximum number of idle connection objects retained for
+                    each scheme/host.  Connections returned to a full pool
+                    are closed.
+    idle_timeout    number of seconds for which an idle connection is retained.
+                    Connections that have been idle for longer than this are
+                    closed rather than reused.
+
+    Connections are not shared across a fork (see above).
+    """
+
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self._maxsize      = maxsize
+        self._idle_timeout = idle_timeout
+        self._lock         = threading.Lock()
+        self._idle         = {}     # (scheme, host) -> [(Http, last_used), ...]
+        self._pid          = os.getpid()
+        self._created      = 0
+        self._reused       = 0
+        return
+
+    def _check_process(self):
+        """
+        If the pool is used in a new process following a fork, discard the idle
+        connections inherited from the parent process.  They are not closed, as
+        their sockets remain in use by the parent.  The lock is also replaced, as
+        another thread of the parent may have held it when the process forked.
+        """
+        pid = os.getpid()
+        if pid != self._pid:
+            log.debug("HTTP_ConnectionPool: discard connections inherited by process %d"%pid)
+            self._lock = threading.Lock()
+            self._idle = {}
+            self._pid  = pid
+        return
+
+    def configure(self, maxsize=None, idle_timeout=None):
+        """
+        Update pool size and/or idle timeout, discarding any idle connections
+        that are no longer permitted.
+        """
+        self._check_process()
+        with self._lock:
+            if maxsize is not None:
+                self._maxsize = maxsize
+            if idle_timeout is not None:
+                self._idle_timeout = idle_timeout
+        self.prune()
+        return
+
+    def acquire(self, scheme, host):
+        """
+        Return an httplib2.Http object for exclusive use by the caller, reusing
+        an idle pooled object for the indicated scheme and host if one is available.
+        """
+        self._check_process()
+        key     = (scheme, host)
+        now     = time.time()
+        expired = []
+        http2   = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                h, last_used = idle.pop()
+                if now - last_used <= self._idle_timeout:
+                    http2 = h
+                    self._reused += 1
+                    break
+                expired.append(h)
+            if http2 is None:
+                self._created += 1
+        for h in expired:
+            close_http(h)
+        if http2 is None:
+            log.debug("HTTP_ConnectionPool.acquire: new connection for %s://%s"%key)
+            http2 = httplib2.Http()
+        return http2
+
+    def release(self, scheme, host, http2):
+        """
+        Return an httplib2.Http object to the pool for reuse.
+        """
+        self._check_process()
+        key = (scheme, host)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._maxsize:
+                idle.append((http2, time.time()))
+                http2 = None
+        if http2 is not None:
+            close_http(http2)
+        return
+
+    def discard(self, http2):
+        """
+        Close an httplib2.Http object rather than returning it to the pool,
+        e.g. following a connection error.
+        """
+        close_http(http2)
+        return
+
+    @contextlib.contextmanager
+    def connection(self, scheme, host):
+        """
+        Context manager that acquires a pooled connection object and releases it
+        on exit, or discards it if an exception is raised.
+        """
+        http2 = self.acquire(scheme, host)
+        try:
+            yield http2
+        except:
+            self.discard(http2)
+            raise
+        self.release(scheme, host, http2)
+        return
+
+    def prune(self):
+        """
+        Close idle connections that have timed out or exceed the pool size.
+        """
+        self._check_process()
+        now     = time.time()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                keep = [ (h, t) for (h, t) in idle if now - t <= self._idle_timeout ]
+                keep = keep[-self._maxsize:] if self._maxsize > 0 else []
+                expired.extend([ h for (h, t) in idle if (h, t) not in keep ])
+                self._idle[key] = keep
+        for h in expired:
+            close_http(h)
+        return
+
+    def close(self):
+        """
+        Close all idle connections held by the pool.
+        """
+        self._check_process()
+        with self._lock:
+            idle       = self._idle
+            self._idle = {}
+        for key in idle:
+            for h, t in idle[key]:
+                close_http(h)
+        return
+
+    def stats(self):
+        """
+        Return dictionary of pool usage counts
+        """
+        self._check_process()
+        with self._lock:
+            return (
+                { "created":    self._created
+                , "reused":     self._reused
+                , "idle":       sum([ len(v) for v in self._idle.values() ])
+                })
+
+# Process-wide connection pool
+
+_connection_pool = HTTP_ConnectionPool()
+
+def get_connection_pool():
+    """
+    Return the process-wide HTTP connection pool
+    """
+    return _connection_pool
+
+def configure_connection_pool(maxsize=None, idle_timeout=None):
+    """
+    Set size and idle timeout for the process-wide HTTP connection pool
+    """
+    _connection_pool.configure(maxsize=maxsize, idle_timeout=idle_timeout)
+    return _connection_pool
+
+# End.
@@ -0,0 +1,136 @@
+"""
+Scheduler for running many URI-based jobs across a number of hosts.
+
+Jobs (e.g. reading and exporting an RDF document) are run by a pool of worker
+threads.  The number of jobs running at once is limited overall, and the number
+of jobs running at once for any one host is limited separately, so that a large
+batch of work is spread across hosts rather than directed at a single server.
+Jobs for hosts that are at their limit wait while jobs for other hosts run.
+
+HTTP requests made by jobs use the process-wide connection pool and caches, so
+connections and cached responses are shared by all jobs.
+
+Usage:
+
+    scheduler = HTTP_Scheduler(max_in_flight=8, max_per_host=2)
+    for uri, result in scheduler.imap_unordered(fn, uris):
+        ...
+"""
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import sys
+import Queue
+import urlparse
+import threading
+import collections
+import logging
+
+# Logger for this module
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 8       # Jobs running at once
+DEFAULT_MAX_PER_HOST  = 2       # Jobs running at once for any one host
+
+def uriHost(uri):
+    """
+    Helper function returns the host (and port) part of a URI, used to group jobs
+    """
+    return urlparse.urlsplit(uri).netloc.lower()
+
+
+class HTTP_Scheduler(object):
+
+    """
+    Run jobs for a collection of URIs, with overall and per-host concurrency limits.
+
+    max_in_flight   maximum number of jobs running at once.
+    max_per_host    maximum number of jobs running at once for URIs with the
+                    same host.
+    """
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_per_host=DEFAULT_MAX_PER_HOST):
+        self._max_in_flight = max(max_in_flight, 1)
+        self._max_per_host  = max(max_per_host, 1)
+        return
+
+    def imap_unordered(self, fn, uris):
+        """
+        Call `fn(uri)` for each of the supplied URIs, and yield (uri, result) pairs
+        as jobs complete.  If a job raises an exception, it is re-raised here.
+        """
+        cond     = threading.Condition()
+        pending  = collections.OrderedDict()    # host -> deque of URIs
+        active   = {}                           # host -> jobs running
+        results  = Queue.Queue()
+        count    = 0
+        for uri in uris:
+            pending.setdefault(uriHost(uri), collections.deque()).append(uri)
+            count += 1
+
+        def take_job():
+            for host in pending.keys():
+                if active.get(host, 0) < self._max_per_host:
+                    queue = pending.pop(host)
+                    uri   = queue.popleft()
+                    if queue:
+                        # Move host to end of the order, so other hosts are next
+                        pending[host] = queue
+                    active[host] = active.get(host, 0) + 1
+                    return (host, uri)
+            return None
+
+        def worker():
+            while True:
+                with cond:
+                    job = None
+                    while pending:
+                        job = take_job()
+                        if job:
+                            break
+                        cond.wait()
+                    if not job:
+                        return
+                (host, uri) = job
+                try:
+                    result = (uri, fn(uri), None)
+                except Exception:
+                    result = (uri, None, sys.exc_info())
+                with cond:
+                    active[host] -= 1
+                    cond.notify_all()
+                results.put(result)
+            return
+
+        threads = []
+        for i in range(min(self._max_in_flight, count)):
+            t = threading.Thread(target=worker, name="HTTP_Scheduler_%d"%i)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        try:
+            for i in range(count):
+                (uri, result, exc_info) = results.get()
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                yield (uri, result)
+        finally:
+            with cond:
+                pending.clear()
+                cond.notify_all()
+            for t in threads:
+                t.join()
+        return
+
+    def map(self, fn, uris):
+        """
+        Call `fn(uri)` for each of the supplied URIs, and return a list of results
+        in the order that the URIs are supplied.
+        """
+        uris    = list(uris)
+        results = dict(self.imap_unordered(fn, uris))
+        return [ results[uri] for uri in uris ]
+
+# End.
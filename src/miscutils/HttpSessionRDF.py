@@ -7,11 +7,21 @@ __copyright__   = "Copyright 2011-2013, University of Oxford"
 __license__     = "MIT (http://opensource.org/licenses/MIT)"
 
 import re   # Used for link header parsing
+import bz2
+import gzip
 import httplib2
 import urlparse
+import StringIO
 import rdflib
 import logging
 
+from rdflib.parser      import InputSource
+
+from HttpConnectionPool import get_connection_pool
+from HttpCache          import get_default_cache
+from GraphCache         import get_default_graphcache
+from NTriplesParser     import parseNTriples
+
 # Logger for this module
 log = logging.getLogger(__name__)
 
@@ -20,11 +30,22 @@ RDF_CONTENT_TYPES = (
     , "text/turtle":            "n3"
     , "text/n3":                "n3"
     , "text/nt":                "nt"
+    , "application/n-triples":  "nt"
     , "application/json":       "jsonld"
     , "application/xhtml":      "rdfa"
     })
 
-ACCEPT_RDF_CONTENT_TYPES = "application/rdf+xml, text/turtle"
+# N-Triples is preferred where available, as it can be parsed much faster (see
+# RDF_STREAM_PARSERS)
+ACCEPT_RDF_CONTENT_TYPES = (
+    "application/n-triples, text/turtle;q=0.9, application/rdf+xml;q=0.8"
+    )
+
+# Parsers used in place of rdflib's own parser for some RDF formats.  Each is
+# called as `parser(stream, graph)`.
+RDF_STREAM_PARSERS = (
+    { "nt":                     parseNTriples
+    })
 
 def splitValues(txt, sep=",", lq='"<', rq='">'):
     """
@@ -108,6 +129,88 @@ def testParseLinks():
     assert str(parseLinks(links)['http://example.org/rel/fas']) == 'http://example.org/fas;far'
 
 
+def parseRDFData(graph, headers, data, baseuri, bodyformat):
+    """
+    Helper function parses the body of an HTTP response as RDF into the supplied
+    graph.  A body with gzip content encoding is decompressed as it is read by
+    the parser, rather than being decompressed in advance.  A body with bzip2
+    content encoding (as served for ".ttl.bz2" files, see MockHttpResources) is
+    decompressed before parsing.
+    """
+    encoding = headers.get("content-encoding", "identity").strip().lower()
+    if encoding in ("bzip2", "x-bzip2"):
+        data     = bz2.decompress(data)
+        encoding = "identity"
+    if encoding in ("gzip", "x-gzip"):
+        stream = gzip.GzipFile(fileobj=StringIO.StringIO(data), mode="rb")
+        parseRDFStream(graph, stream, baseuri, bodyformat)
+    elif encoding == "identity":
+        if bodyformat in RDF_STREAM_PARSERS:
+            parseRDFStream(graph, StringIO.StringIO(data), baseuri, bodyformat)
+        else:
+            graph.parse(data=data, publicID=baseuri, format=bodyformat)
+    else:
+        raise ValueError("Unsupported content encoding: %s"%encoding)
+    return graph
+
+def parseRDFStream(graph, stream, baseuri, bodyformat):
+    """
+    Helper function parses RDF from a file-like object into the supplied graph.
+    """
+    if bodyformat in RDF_STREAM_PARSERS:
+        return RDF_STREAM_PARSERS[bodyformat](stream, graph)
+    source = InputSource(system_id=baseuri)
+    source.setByteStream(stream)
+    graph.parse(source=source, publicID=baseuri, format=bodyformat)
+    return graph
+
+def parseRDFResponse(status, reason, headers, data, baseuri, graph=None, graphcache=None):
+    """
+    Helper function to parse the body of a successful HTTP response as RDF.
+
+    If the response status is 2xx, the body is parsed according to its content
+    type and added to the supplied graph (or a new graph if none is supplied),
+    or a fake 9xx status is returned if RDF cannot be parsed.
+    Otherwise the response status, reason and body are returned unchanged.
+
+    If a parsed-graph cache (see GraphCache) is supplied, the cached triples for
+    the response are used if available, and the parser is invoked only on a
+    cache miss.
+
+    Returns status, reason(text), response graph or body
+    """
+    if status >= 200 and status < 300:
+        content_type = headers["content-type"].split(";",1)[0].strip().lower()
+        if content_type in RDF_CONTENT_TYPES:
+            rdfgraph   = graph if graph != None else rdflib.graph.Graph()
+            bodyformat = RDF_CONTENT_TYPES[content_type]
+            # log.debug("HTTP_Session.doRequestRDF data:\n----\n"+data+"\n------------")
+            try:
+                if graphcache:
+                    cachekey = graphcache.key(baseuri, headers, data)
+                    if not graphcache.load(cachekey, rdfgraph):
+                        docgraph = rdflib.graph.Graph()
+                        parseRDFData(docgraph, headers, data, baseuri, bodyformat)
+                        graphcache.save(cachekey, docgraph)
+                        for prefix, namespace in docgraph.namespaces():
+                            rdfgraph.bind(prefix, namespace, override=True)
+                        rdfgraph += docgraph
+                else:
+                    # rdfgraph.parse(data=data, location=baseuri, format=bodyformat)
+                    parseRDFData(rdfgraph, headers, data, baseuri, bodyformat)
+                data = rdfgraph
+            except Exception, e:
+                log.info("HTTP_Session.doRequestRDF: %s"%(e))
+                log.info("HTTP_Session.doRequestRDF parse failure: '%s', '%s'"%(content_type, bodyformat))
+                # log.debug("HTTP_Session.doRequestRDF data:\n----\n"+data[:200]+"\n------------")
+                status   = 902
+                reason   = "RDF (%s) parse failure"%bodyformat
+        else:
+            status   = 901
+            reason   = "Non-RDF content-type returned"
+    return (status, reason, data)
+
+
 # Class for exceptions raised by HTTP session
 
 class HTTP_Error(Exception):
@@ -146,9 +249,18 @@ class HTTP_Session(object):
     to allow URIs that use different scheme, hostname or port than the original
     request, but such requests are not issued using the access key of the HTTP
     session.
+
+    Connections are taken from a process-wide pool of keep-alive connections
+    (see HttpConnectionPool), so that successive sessions to the same host do
+    not each pay for a new connection setup.  A different pool may be supplied
+    using the "pool" parameter.
+
+    GET requests are satisfied via an on-disk HTTP_Cache, if one is supplied
+    using the "cache" parameter or set as the process-wide default (see HttpCache).
+    Similarly, RDF responses are parsed via a "graphcache" (see GraphCache).
     """
 
-    def __init__(self, baseuri, accesskey=None):
+    def __init__(self, baseuri, accesskey=None, pool=None, cache=None, graphcache=None):
         log.debug("HTTP_Session.__init__: baseuri "+baseuri)
         self._baseuri = baseuri
         self._key     = accesskey
@@ -156,7 +268,9 @@ class HTTP_Session(object):
         self._scheme  = parseduri.scheme
         self._host    = parseduri.netloc
         self._path    = parseduri.path
-        self._http2   = httplib2.Http()
+        self._pool    = pool or get_connection_pool()
+        self._cache   = cache or get_default_cache()
+        self._gcache  = graphcache or get_default_graphcache()
         return
 
     def __enter__(self):
@@ -168,7 +282,9 @@ class HTTP_Session(object):
 
     def close(self):
         self._key   = None
-        self._http2 = None
+        self._pool  = None
+        self._cache = None
+        self._gcache = None
         return
 
     def baseuri(self):
@@ -206,10 +322,9 @@ class HTTP_Session(object):
         Return:
              status, reason(text), response headers, response body
 
-        Note: relies on timeout or object deallocation to close connections:
+        Note: connections are held open for reuse by the connection pool, which
+        closes them when they have been idle for longer than its timeout:
         see http://stackoverflow.com/questions/16687033/is-this-a-bug-of-httplib2.
-        Python's reference counting should ensure Http objects amnd referenced connections
-        are deallocated promptly.
         """
         # Construct request path
         urifull  = self.getpathuri(uripath)
@@ -249,8 +364,26 @@ class HTTP_Session(object):
         log.debug("HTTP_Session.doRequest path:       "+path)
         log.debug("HTTP_Session.doRequest reqheaders: "+repr(reqheaders))
         log.debug("HTTP_Session.doRequest body:       "+repr(body))
-        (resp, data) = self._http2.request(urifull, 
-            method=method, body=body, headers=reqheaders)
+        if self._cache and method == "GET":
+            def do_request(condheaders):
+                condreqheaders = dict(reqheaders)
+                condreqheaders.update(condheaders)
+                return self._doHttpRequest(urifull, uriparts,
+                    method=method, body=body, reqheaders=condreqheaders)
+            return self._cache.request(urifull, accept, do_request)
+        return self._doHttpRequest(urifull, uriparts,
+            method=method, body=body, reqheaders=reqheaders)
+
+    def _doHttpRequest(self, urifull, uriparts, method="GET", body=None, reqheaders=None):
+        """
+        Issue HTTP request using a pooled connection.
+
+        Return:
+             status, reason(text), response headers, response body
+        """
+        with self._pool.connection(uriparts.scheme, uriparts.netloc) as http2:
+            (resp, data) = http2.request(urifull, 
+                method=method, body=body, headers=reqheaders)
         # Pick out elements of response
         try:
             status   = resp.status
@@ -261,7 +394,7 @@ class HTTP_Session(object):
             log.debug("HTTP_Session.doRequest response:   "+str(status)+" "+reason)
             log.debug("HTTP_Session.doRequest rspheaders: "+repr(headers))
         except Exception, e:
-            log.warn("HTTP_Session error %r accessing %s with request headers %r"%(e, uripath, reqheaders))
+            log.warn("HTTP_Session error %r accessing %s with request headers %r"%(e, urifull, reqheaders))
             status = 900
             reason = str(e)
             headers = {"_headerlist": []}
@@ -293,7 +426,7 @@ class HTTP_Session(object):
             method=method, accept=accept,
             body=body, ctype=ctype, reqheaders=reqheaders, 
             exthost=exthost)
-        return (status, reason, headers, headers['content-location'], data)
+        return (status, reason, headers, headers.get('content-location', None), data)
 
     def doRequestRDFFollowRedirect(self, uripath, 
             method="GET", body=None, ctype=None, reqheaders=None, exthost=False, graph=None):
@@ -324,26 +457,10 @@ class HTTP_Session(object):
             method=method, body=body,
             ctype=ctype, accept=ACCEPT_RDF_CONTENT_TYPES, reqheaders=reqheaders, 
             exthost=exthost)
-        if status >= 200 and status < 300:
-            content_type = headers["content-type"].split(";",1)[0].strip().lower()
-            if content_type in RDF_CONTENT_TYPES:
-                rdfgraph   = graph if graph != None else rdflib.graph.Graph()
-                baseuri    = self.getpathuri(uripath)
-                bodyformat = RDF_CONTENT_TYPES[content_type]
-                # log.debug("HTTP_Session.doRequestRDF data:\n----\n"+data+"\n------------")
-                try:
-                    # rdfgraph.parse(data=data, location=baseuri, format=bodyformat)
-                    rdfgraph.parse(data=data, publicID=baseuri, format=bodyformat)
-                    data = rdfgraph
-                except Exception, e:
-                    log.info("HTTP_Session.doRequestRDF: %s"%(e))
-                    log.info("HTTP_Session.doRequestRDF parse failure: '%s', '%s'"%(content_type, bodyformat))
-                    # log.debug("HTTP_Session.doRequestRDF data:\n----\n"+data[:200]+"\n------------")
-                    status   = 902
-                    reason   = "RDF (%s) parse failure"%bodyformat
-            else:
-                status   = 901
-                reason   = "Non-RDF content-type returned"
+        (status, reason, data) = parseRDFResponse(
+            status, reason, headers, data, self.getpathuri(uripath),
+            graph=graph, graphcache=self._gcache
+            )
         return (status, reason, headers, finaluri, data)
 
     def doRequestRDF(self, uripath, 
@@ -15,16 +15,36 @@ import urllib
 import httpretty
 import ScanDirectories
 
-from FileMimeTypes import FileMimeTypes
+from FileMimeTypes import FileMimeTypes, FileContentEncodings
 
 FileType_MimeType = dict([ (ft,ct) for (ct, fts) in FileMimeTypes
                                    for ft in fts ])
 
+FileType_Encoding = dict([ (ft,ce) for (ce, fts) in FileContentEncodings
+                                   for ft in fts ])
+
+def HttpContentTypeEncoding(filename):
+    """
+    Return content type and content encoding (or None) for a filename, using
+    compound extensions like ".ttl.gz" to indicate an encoded file.
+    """
+    fsplit = filename.rsplit(".", 2)
+    if ( len(fsplit) == 3 and fsplit[2] in FileType_Encoding and
+         fsplit[1] in FileType_MimeType ):
+        return (FileType_MimeType[fsplit[1]], FileType_Encoding[fsplit[2]])
+    if len(fsplit) >= 2 and fsplit[-1] in FileType_MimeType:
+        return (FileType_MimeType[fsplit[-1]], None)
+    return ("application/octet-stream", None)
+
 def HttpContentType(filename):
-    fsplit = filename.rsplit(".", 1)
-    if len(fsplit) == 2 and fsplit[1] in FileType_MimeType:
-        return FileType_MimeType[fsplit[1]]
-    return "application/octet-stream"
+    return HttpContentTypeEncoding(filename)[0]
+
+def HttpContentEncoding(filename):
+    return HttpContentTypeEncoding(filename)[1]
+
+def HttpEncodingHeaders(filename):
+    ce = HttpContentEncoding(filename)
+    return {"Content-Encoding": ce} if ce else {}
 
 class MockHttpFileResources(object):
 
@@ -41,10 +61,12 @@ class MockHttpFileResources(object):
         for r in refs:
             ru = self._baseuri + urllib.pathname2url(r)
             rt = HttpContentType(r)
-            with open(self._path+r, 'r') as cf:
+            rh = HttpEncodingHeaders(r)
+            with open(self._path+r, 'rb') as cf:
                 httpretty.register_uri(httpretty.GET,  ru, status=200, content_type=rt,
-                    body=cf.read())
-                httpretty.register_uri(httpretty.HEAD, ru, status=200, content_type=rt)
+                    body=cf.read(), adding_headers=rh)
+                httpretty.register_uri(httpretty.HEAD, ru, status=200, content_type=rt,
+                    adding_headers=rh)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -65,9 +87,11 @@ class MockHttpDictResources(object):
         for r in self._dict.keys():
             ru = self._baseuri + r
             rt = HttpContentType(r)
+            rh = HttpEncodingHeaders(r)
             httpretty.register_uri(httpretty.GET,  ru, status=200, content_type=rt,
-                body=self._dict[r])
-            httpretty.register_uri(httpretty.HEAD, ru, status=200, content_type=rt)
+                body=self._dict[r], adding_headers=rh)
+            httpretty.register_uri(httpretty.HEAD, ru, status=200, content_type=rt,
+                adding_headers=rh)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
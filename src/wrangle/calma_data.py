@@ -8,28 +8,360 @@ import sys
 import os
 import re
 import json
+import time
+import socket
+import httplib
+import httplib2
 import urlparse
+import collections
+import multiprocessing
+
+from multiprocessing.pool import ThreadPool
 
 from rdflib import Graph, Literal, BNode, Namespace, RDF, URIRef
 from rdflib.namespace import RDF, RDFS  #, DC, FOAF
 
-from miscutils.HttpSessionRDF import HTTP_Session
+from miscutils.HttpSessionRDF     import (
+    HTTP_Session, parseRDFResponse, ACCEPT_RDF_CONTENT_TYPES
+    )
+from miscutils.HttpConnectionPool import configure_connection_pool, get_connection_pool
+from miscutils.HttpAsyncFetch     import HTTP_AsyncFetcher
+from miscutils.HttpScheduler      import HTTP_Scheduler
+from miscutils.FileRDF            import readRDFFile
+from miscutils.CompactStore       import RDF_CompactStore
+from miscutils.UriUtils           import isFileUri, resolveFileAsUri, getFilenameFromUri
+from miscutils.HttpCache          import HTTP_Cache, get_default_cache, set_default_cache
+from miscutils.GraphCache         import (
+    RDF_GraphCache, get_default_graphcache, set_default_graphcache
+    )
 
 from wrangle_errors import wrangle_errors, wrangle_unexpected, wrangle_missingarg, wrangle_report
+from getargvalue    import getargvaluelist
+from graph_index    import graph_index
+from rdf_collections import container_members, member_number
+from rdf_bnodes     import bnode_value
+from id_rules       import (
+    field_key, SUBJECT_ID_RULES, ACTIVITY_ID_RULES, FEATURE_SERIES_ID_RULES
+    )
+from export_manifest import export_manifest
+from export_writer   import export_writer
+from export_bundle   import export_bundle, read_bundle
+from entity_layout   import entity_layout, SHARD_MAP_NAME
+from export_journal  import export_journal
+from feature_store   import (
+    numpy, CALMA, FEATURE_DIR, extract_feature_series, subject_document
+    )
 
 PROV = Namespace("http://www.w3.org/ns/prov#")
 
+def configure_http(options):
+    """
+    Apply HTTP access options from the command line to the process-wide
+    connection pool, response cache and parsed-graph cache used by all
+    HTTP sessions.
+    """
+    configure_connection_pool(
+        maxsize=options.pool_size, idle_timeout=options.pool_idle_timeout
+        )
+    if options.cache_dir:
+        cachedir = os.path.expanduser(options.cache_dir)
+        set_default_cache(
+            HTTP_Cache(os.path.join(cachedir, "http"), max_age=options.cache_max_age)
+            )
+        if not options.no_graph_cache:
+            set_default_graphcache(RDF_GraphCache(os.path.join(cachedir, "graph")))
+    return
+
+# Selects store used for graphs of RDF data read (see configure_rdf)
+_compact_store = False
+
+def configure_rdf(options):
+    """
+    Apply RDF graph options from the command line.
+
+    With --compact-store, RDF data read is held in graphs using RDF_CompactStore,
+    which needs much less memory than rdflib's default in-memory store.
+    """
+    global _compact_store
+    _compact_store = options.compact_store
+    return
+
+def new_graph():
+    """
+    Return a new empty graph for RDF data read, using the store selected by
+    configure_rdf.
+    """
+    if _compact_store:
+        return Graph(store=RDF_CompactStore())
+    return Graph()
+
+def report_http():
+    """
+    Report HTTP response and parsed-graph cache usage, if caches are in use.
+    """
+    for cache in (get_default_cache(), get_default_graphcache()):
+        if cache:
+            print(cache.report(), file=sys.stderr)
+    return
+
+def cache_counts(since=None):
+    """
+    Return list of usage counts for the HTTP response and parsed-graph caches
+    (None for a cache that is not in use), less any counts `since` returned by
+    an earlier call.  Used to pass the counts for work done by a worker process
+    to the parent process (see merge_cache_counts).
+    """
+    counts = []
+    for i, cache in enumerate((get_default_cache(), get_default_graphcache())):
+        c = cache.stats() if cache else None
+        if c and since and since[i]:
+            c = dict( (k, n - since[i].get(k, 0)) for k, n in c.items() )
+        counts.append(c)
+    return counts
+
+def merge_cache_counts(counts):
+    """
+    Add cache usage counts returned by a worker process to this process's caches,
+    so that they are included in the cache usage report.
+    """
+    for cache, c in zip((get_default_cache(), get_default_graphcache()), counts or []):
+        if cache and c:
+            cache.merge_stats(c)
+    return
+
+# Local copies of CALMA data files, keyed by each final part of their path of
+# two or more segments (so including at least the track directory), without
+# type or compression extensions (see add_local_files)
+_local_files = {}
+
+LOCAL_FILE_PATTERN = re.compile(r"^((analyses|analysis_.*)\.(nt|ttl))(\.gz|\.bz2)?$")
+
+LOCAL_FILE_TYPES   = ("nt", "ttl")      # In order of preference
+
+def add_local_files(dirname):
+    """
+    Find analyses listing and analysis files (analyses.ttl and analysis_*.ttl)
+    in a local directory tree, such as a copy of the CALMA data tree, and note
+    them so that references to corresponding remote URLs are read from the
+    local files (see local_filename).
+
+    N-Triples files (.nt) are also recognized, and are used in preference to
+    Turtle files with the same name, as are compressed files with an additional
+    .gz or .bz2 extension.
+
+    Returns a pair of sorted lists of file:// URIs for the listing and analysis
+    files used.
+
+    Files are noted by their path relative to the parent of the given directory,
+    so that the path includes the track directory even when `dirname` is the
+    directory for a single track.
+    """
+    found   = {}
+    rootdir = os.path.dirname(os.path.abspath(dirname))
+    for dirpath, dirnames, filenames in os.walk(dirname):
+        for fn in filenames:
+            m = LOCAL_FILE_PATTERN.match(fn)
+            if m:
+                reldir  = os.path.relpath(os.path.abspath(dirpath), rootdir)
+                relpath = reldir.replace(os.sep, "/")+"/"+m.group(2)
+                rank    = (LOCAL_FILE_TYPES.index(m.group(3)), m.group(4) or "")
+                if relpath not in found or rank < found[relpath][0]:
+                    found[relpath] = (rank, os.path.join(dirpath, fn))
+    listings = []
+    analyses = []
+    for relpath in sorted(found):
+        path     = found[relpath][1]
+        segments = relpath.split("/")
+        for i in range(len(segments)-1):
+            _local_files["/".join(segments[i:])] = path
+        if segments[-1] == "analyses":
+            listings.append(resolveFileAsUri(path))
+        else:
+            analyses.append(resolveFileAsUri(path))
+    return (listings, analyses)
+
+def local_filename(url):
+    """
+    Return local file name for a file:// URI, or for a remote URL that refers to
+    a file found by add_local_files, or None.
+
+    A remote URL refers to a local file if at least the final two segments of
+    its path (i.e. the track directory and file name) are the same as the final
+    segments of the local file's path, ignoring any type or compression
+    extensions.  A file name alone is never matched, as every track has files
+    with the same names.
+    """
+    if isFileUri(url):
+        return getFilenameFromUri(url)
+    if _local_files:
+        segments = urlparse.urlsplit(url).path.split("/")
+        m = LOCAL_FILE_PATTERN.match(segments[-1])
+        if m:
+            segments[-1] = m.group(2)
+        for i in range(1, len(segments)-1):
+            filename = _local_files.get("/".join(segments[i:]), None)
+            if filename:
+                return filename
+    return None
+
+def listing_sources(src):
+    """
+    Return list of analyses listing URIs for a command line source value, which
+    may be a URL, a local file name, or a local directory in which case the
+    listing files found in it are returned (see add_local_files).
+
+    For a local listing file, analyses that it references are read from the
+    directory that contains it.
+    """
+    if os.path.isdir(src):
+        listings, analyses = add_local_files(src)
+        return listings
+    url = resolveFileAsUri(src)
+    if isFileUri(url):
+        add_local_files(os.path.dirname(getFilenameFromUri(url)))
+    return [url]
+
+def read_rdf_source(src):
+    """
+    Read RDF from a command line source value, which may be a URL, a local file
+    name, or a local directory in which case all analyses listing and analysis
+    files found in it are read and merged.
+
+    Returns a pair (status, graph).
+    """
+    if os.path.isdir(src):
+        listings, analyses = add_local_files(src)
+        return read_rdf_multiple(listings+analyses)
+    return read_rdf(resolveFileAsUri(src))
+
 def read_rdf(url, graph=None):
     """
     Read analysis from supplied URL
     """
-    with HTTP_Session(url) as http:
-        (status, reason, headers, rdf) = http.doRequestRDF(url, graph=graph)
-        if status != 200:
-            return wrangle_report(
+    (status, reason, rdf) = fetch_rdf(url, graph=graph)
+    if status != 200:
+        return (
+            wrangle_report(
                 wrangle_errors.HTTPFAIL,
-                "HTTP error response %03d %s"%(status, reason)
+                "HTTP error response %03d %s (%s)"%(status, reason, url)
+                ),
+            None
+            )
+    return (wrangle_errors.SUCCESS, rdf)
+
+def fetch_rdf(url, graph=None, progress=None):
+    """
+    Read RDF from supplied URL.
+
+    Returns (status, reason, rdf), where status is the HTTP response status,
+    a fake 9xx status if the response cannot be parsed as RDF (see
+    HttpSessionRDF.parseRDFResponse), or 0 if the request could not be
+    completed.  The RDF graph is returned only if the status is 200.
+
+    If supplied, `progress` is called with "fetched" when a response has been
+    received, and with "parsed" when it has been read as RDF.
+
+    File URIs, and URLs for local copies of files (see local_filename), are read
+    directly from the local file system.
+    """
+    if graph is None:
+        graph = new_graph()
+    filename = local_filename(url)
+    if filename is not None:
+        if progress:
+            progress("fetched")
+        (status, reason, rdf) = readRDFFile(
+            filename, url, graph=graph, graphcache=get_default_graphcache()
+            )
+        if status == 200 and progress:
+            progress("parsed")
+        return (status, reason, rdf)
+    try:
+        with HTTP_Session(url) as http:
+            (status, reason, headers, finaluri, data) = http.doRequestFollowRedirect(
+                url, accept=ACCEPT_RDF_CONTENT_TYPES
                 )
+            if status == 200 and progress:
+                progress("fetched")
+            (status, reason, rdf) = parseRDFResponse(
+                status, reason, headers, data, http.getpathuri(url),
+                graph=graph, graphcache=get_default_graphcache()
+                )
+    except (socket.error, httplib.HTTPException, httplib2.HttpLib2Error) as e:
+        return (0, str(e), None)
+    if status != 200:
+        return (status, reason, None)
+    if progress:
+        progress("parsed")
+    return (status, reason, rdf)
+
+def merge_graph(rdf, g):
+    """
+    Merge triples and namespace prefix bindings from graph `g` into graph `rdf`.
+
+    Bindings are replayed as the RDF parsers apply them when reading a document
+    into an existing graph (i.e. with override=True), so that merging graphs in
+    the order their documents were read gives the same prefixes as reading the
+    documents one at a time into a single graph.
+    """
+    for prefix, namespace in g.namespaces():
+        rdf.bind(prefix, namespace, override=True)
+    rdf += g
+    return rdf
+
+def read_rdf_multiple(urls, graph=None, jobs=1, async_fetch=False):
+    """
+    Read RDF from each of the supplied URLs, and merge into a single graph.
+
+    If `jobs` is greater than 1, up to that many URLs are fetched and parsed
+    concurrently, each into a separate graph, and the results are then merged
+    in the order that the URLs are supplied, so the resulting graph is the same
+    as that obtained by reading them one at a time.
+
+    If `async_fetch` is True, all URLs are fetched by a single-threaded
+    event-driven fetcher, with up to `jobs` concurrent connections per host,
+    and then parsed in the order supplied.
+
+    Returns a pair (status, graph), where the status is that of the first
+    URL that could not be read, if any.
+    """
+    rdf = graph if graph is not None else new_graph()
+    # Local files are read directly rather than by the event-driven fetcher
+    if async_fetch and not [ u for u in urls if local_filename(u) is not None ]:
+        for url in urls:
+            print("CALMA analysis URL %s"%url)
+        fetcher = HTTP_AsyncFetcher(max_per_host=max(jobs, 1))
+        results = fetcher.fetchRDF(urls, graph=rdf)
+        for url in urls:
+            (status, reason, headers, finaluri, data) = results[url]
+            if status != 200:
+                return (
+                    wrangle_report(
+                        wrangle_errors.HTTPFAIL,
+                        "HTTP error response %03d %s (%s)"%(status, reason, url)
+                        ),
+                    None
+                    )
+        return (wrangle_errors.SUCCESS, rdf)
+    if jobs <= 1:
+        for url in urls:
+            print("CALMA analysis URL %s"%url)
+            status, rdf = read_rdf(url, graph=rdf)
+            if status != wrangle_errors.SUCCESS:
+                return (status, None)
+        return (wrangle_errors.SUCCESS, rdf)
+    for url in urls:
+        print("CALMA analysis URL %s"%url)
+    pool = ThreadPool(jobs)
+    try:
+        results = pool.map(read_rdf, urls)
+    finally:
+        pool.close()
+        pool.join()
+    for status, g in results:
+        if status != wrangle_errors.SUCCESS:
+            return (status, None)
+        merge_graph(rdf, g)
     return (wrangle_errors.SUCCESS, rdf)
 
 def explore_analysis(srcroot, userhome, userconfig, options):
@@ -44,23 +376,23 @@ def explore_analysis(srcroot, userhome, userconfig, options):
         return wrangle_missingarg("analysis URL", options)
     url    = options.args[0]
     print("CALMA analysis URL %s"%url)
-    status, rdf = read_rdf(url)
+    status, rdf = read_rdf_source(url)
     if status != wrangle_errors.SUCCESS:
         return status
     # Poke around data and show some information
     print("Read RDF at %s"%url)
-    for t in sorted(set(rdf.objects(None, RDF.type))):
+    index = graph_index(rdf)
+    for t in index.types():
         print("RDF type: %s"%t)
         tt = set()
-        for s in rdf.subjects(RDF.type, t):
-            tt = tt | set(rdf.objects(s, RDF.type))
+        for s in index.subjects(t):
+            tt = tt | index.subject_types[s]
         tt.discard(t)
         if tt != set():
             print("    Additional types %s"%([str(ttt) for ttt in sorted(tt)]))
-        for s in rdf.subjects(RDF.type, t):
-            for p in sorted(set(rdf.predicates(s, None))):
-                if p != RDF.type:
-                    print("    property: %s"%p)
+        for s in index.subjects(t):
+            for p in sorted(index.predicates(s)):
+                print("    property: %s"%p)
     # for p in sorted(set(rdf.predicates(None, None))):
     #     print("RDF property: %s"%p)
     return status
@@ -69,10 +401,7 @@ def property_name_field_key(rdf, p):
     """
     Return JSON property key for supplied RDF predicate
     """
-    prefix, namespace, name = rdf.namespace_manager.compute_qname(p)
-    pf = "%s_field"%name
-    pk = "%s:%s"%(prefix, name) if prefix else str(p)
-    return (name, pf, pk)
+    return field_key(rdf.namespace_manager, p)
 
 def get_type_info(rdf, t):
     """
@@ -101,78 +430,217 @@ def get_type_info(rdf, t):
         })
     return td
 
-def get_subject_info(rdf, s):
+def get_type_info_indexed(rdf, t, index):
     """
-    Extract information about a generic subject resource
+    Return type information for type `t`, computing it just once for each type
+    in the supplied graph index.
+    """
+    if t not in index.type_info:
+        index.type_info[t] = get_type_info(rdf, t)
+    return index.type_info[t]
+
+def get_entity_info(rdf, s, rules, t=None, index=None):
+    """
+    Extract information about a subject resource, using identifier rules
+    selected for type `t` from the supplied rule set (see id_rules).
+
+    Blank node values are exported as nested JSON values describing the blank
+    node (see rdf_bnodes), and RDF containers or collections as lists of their
+    members.  If the subject is itself a container, its members are exported
+    as a list value for rdfs:member, in place of separate rdf:_N values.  If a
+    graph index is supplied, it is used to find members and to reuse values of
+    blank nodes that are shared by several subjects.
     """
     if not isinstance(s, URIRef): return None
+    rule = rules.rule_for_type(t)
     prefix, namespace, name = rdf.namespace_manager.compute_qname(s)
-    label   = rdf.value(subject=s, predicate=RDFS.label)   or "Resource %s:%s"%(prefix, name)
-    comment = rdf.value(subject=s, predicate=RDFS.comment) or "Resource %s:%s (%s)"%(prefix, name, s)
+    eid     = rule.entity_id(namespace, name)
+    vals    = { "prefix": prefix, "name": name, "uri": s, "id": eid }
+    label   = rdf.value(subject=s, predicate=RDFS.label)   or rule.label_format%vals
+    comment = rdf.value(subject=s, predicate=RDFS.comment) or rule.comment_format%vals
     sd = (
         { "annal:uri":        "%s:%s"%(prefix, name) if prefix else str(s)
-        , "annal:id":         name
+        , "annal:id":         eid
         , "rdfs:label":       label
         , "rdfs:comment":     comment
         , "rdfs:seeAlso":     str(s)
         })
+    nsm = rdf.namespace_manager
     for p, o in rdf.predicate_objects(s):
-        if p != RDF.type:
-            pn, pf, pk = property_name_field_key(rdf, p)
-            sd[pk] = str(o)
+        if p != RDF.type and member_number(p) is None:
+            pn, pf, pk = field_key(nsm, p)
+            if isinstance(o, BNode):
+                sd[pk] = bnode_value(rdf, o, index=index)
+            else:
+                sd[pk] = str(o)
+    members = container_members(rdf, s, index=index)
+    if members is not None:
+        pn, pf, pk = field_key(nsm, RDFS.member)
+        sd[pk] = [ bnode_value(rdf, m, index=index) if isinstance(m, BNode) else str(m)
+                   for m in members ]
     return sd
 
-def get_activity_info(rdf, s):
+def get_subject_info(rdf, s, t=None, index=None):
+    """
+    Extract information about a generic subject resource
+    """
+    return get_entity_info(rdf, s, SUBJECT_ID_RULES, t=t, index=index)
+
+def get_activity_info(rdf, s, t=None, index=None):
     """
     Extract information about an activity resource
 
     This differs from get_subject_info in that it folds the last part of the URI path
     into the generated entity identifier.
     """
-    if not isinstance(s, URIRef): return None
-    prefix, namespace, frag = rdf.namespace_manager.compute_qname(s)
-    upath = urlparse.urlparse(str(namespace)).path
-    uname = upath.rsplit("/",1)[1]
-    m = re.search("-([a-z0-9]{12})$", uname)
-    if m:
-        ustem = m.group(1)
+    return get_entity_info(rdf, s, ACTIVITY_ID_RULES, t=t, index=index)
+
+def collection_dir():
+    """
+    Return directory of Annalist collection to which data is exported
+    """
+    return os.path.join(os.path.expanduser("~"), "annalist_site/c/CALMA_data")
+
+# Manifest of exported files, used for incremental export (see begin_export)
+_export_manifest = None
+
+# Writer for exported files: synchronous unless --writers is used (see begin_export)
+_export_writer = export_writer()
+
+# Entity directory layout, and sharded types for which a shard map has been
+# exported (see begin_export)
+_entity_layout = entity_layout()
+_shard_maps    = set()
+
+# Format of feature files for event series, or None to export events as
+# entities (see begin_export and export_feature_series)
+_feature_store = None
+
+def begin_export(options):
+    """
+    Prepare for export to the Annalist collection, as selected by command line options.
+
+    With --incremental, a manifest of previously exported file contents is used
+    to avoid rewriting unchanged files.
+
+    With --writers N, exported files are written by N background threads.
+
+    With --bundle FILE, exported files are written to a single bundle file
+    rather than to the collection directory (see explode_bundle).
+
+    With --shard-fanout N, entities are exported to a sharded directory layout
+    (see entity_layout).
+
+    With --feature-store FORMAT, event series in analyses are exported as NumPy
+    array files (see export_feature_series).
+
+    Returns a status value.
+    """
+    global _export_manifest, _export_writer, _entity_layout, _feature_store
+    _export_manifest = None
+    _entity_layout   = entity_layout(fanout=options.shard_fanout, types=options.shard_types)
+    _shard_maps.clear()
+    _feature_store   = options.feature_store
+    if _feature_store and numpy is None:
+        return wrangle_report(wrangle_errors.BADCMD,
+            "--feature-store requires NumPy, which is not installed"
+            )
+    if options.bundle:
+        if options.processes > 1 or options.incremental or options.prune or options.journal:
+            return wrangle_report(wrangle_errors.BADCMD,
+                "--bundle cannot be used with --processes, --incremental, --prune or --journal"
+                )
+        _export_writer = export_bundle(options.bundle, collection_dir())
+        return wrangle_errors.SUCCESS
+    if options.incremental or options.prune:
+        _export_manifest = export_manifest(collection_dir())
+    _export_writer = export_writer(threads=options.writers)
+    return wrangle_errors.SUCCESS
+
+def end_export(options, status):
+    """
+    Complete export to the Annalist collection: wait for queued file writes,
+    report (or, with --prune, remove) files from earlier exports that were not
+    produced by this one, and save the export manifest.
+    """
+    global _export_manifest, _export_writer
+    manifest         = _export_manifest
+    _export_manifest = None
+    writer           = _export_writer
+    _export_writer   = export_writer()
+    write_status     = report_write_errors(writer.close())
+    if status == wrangle_errors.SUCCESS:
+        status = write_status
+    if manifest is None or status != wrangle_errors.SUCCESS:
+        return status
+    print("Export: %d files written, %d unchanged"%(manifest.written, manifest.unchanged))
+    if options.prune:
+        for path in manifest.prune():
+            print("Removed stale file %s"%(path))
     else:
-        ustem = uname.replace("-", "_")
-    actid = "%s_%s"%(ustem, frag.replace("-", "_"))
-    if len(actid) > 32:
-        actid = actid[0:8]+"___"+actid[-20:]
-    label   = (
-        rdf.value(subject=s, predicate=RDFS.label) or 
-        "Resource %s:%s"%(prefix, frag)
-        )
-    comment = (
-        rdf.value(subject=s, predicate=RDFS.comment) or 
-        "Resource %s:%s (%s), id %s"%(prefix, frag, s, actid)
-        )
-    sd = (
-        { "annal:uri":        "%s:%s"%(prefix, frag) if prefix else str(s)
-        , "annal:id":         actid
-        , "rdfs:label":       label
-        , "rdfs:comment":     comment
-        , "rdfs:seeAlso":     str(s)
-        })
-    for p, o in rdf.predicate_objects(s):
-        if p != RDF.type:
-            pn, pf, pk = property_name_field_key(rdf, p)
-            sd[pk] = str(o)
-    return sd
+        stale = manifest.stale()
+        if stale:
+            print("%d stale files from earlier exports (use --prune to remove):"%len(stale))
+            for path in stale:
+                print("  %s"%(path))
+    manifest.save()
+    return status
+
+def report_write_errors(errors):
+    """
+    Report errors returned by the export writer, and return a status value
+    """
+    for filename, e in errors:
+        wrangle_report(wrangle_errors.WRITEFAIL, "Error writing %s: %s"%(filename, e))
+    return wrangle_errors.WRITEFAIL if errors else wrangle_errors.SUCCESS
+
+def flush_export():
+    """
+    Wait for queued writes of exported files to complete, e.g. before a worker
+    process returns its results, and return a status value.
+    """
+    return report_write_errors(_export_writer.flush())
+
+def export_manifest_updates(recent=False):
+    """
+    Return manifest updates from a worker process, or None
+    (see export_manifest.updates)
+    """
+    return _export_manifest.updates(recent=recent) if _export_manifest else None
+
+def export_manifest_counts():
+    """
+    Return (written, unchanged) counts of files checked by the current thread
+    since this was last called, or None (see export_manifest.counts)
+    """
+    return _export_manifest.counts(recent=True) if _export_manifest else None
+
+def merge_export_manifest_updates(updates, counts=None):
+    """
+    Merge manifest updates and file counts returned by a worker process
+    """
+    if _export_manifest and (updates or counts):
+        _export_manifest.merge(updates, counts=counts)
+    return
 
 def export_entity(ef, ed):
     """
-    Write entity data to file, creating directories as needed
+    Write entity data to file, creating directories as needed.
+
+    Data is serialized here, and the file may be written by a background thread.
     """
-    try:
-        os.makedirs(os.path.dirname(ef))
-    except OSError as e:
-        # print("Caught OSError: %s"%str(e), file=sys.stderr)
-        pass
-    with open(ef, "wt") as fs:
-        fs.write(json.dumps(ed, indent=2))
+    export_file(ef, json.dumps(ed, indent=2))
+    return
+
+def export_file(ef, data):
+    """
+    Write serialized data to an exported file, or to the export bundle.
+
+    For incremental export, files whose content is unchanged are not rewritten.
+    """
+    if _export_manifest and not _export_manifest.check(ef, data):
+        return
+    _export_writer.write(ef, data)
     return
 
 def export_type(rdf, t, td, colldir):
@@ -223,9 +691,34 @@ def export_list(rdf, t, td, colldir):
     export_entity(ef, ed)
     return
 
-def export_view(rdf, t, td, colldir):
+def get_view_fields(rdf, t, fields=None, index=None):
     """
-    Export Annalist list description for type `t`
+    Return an ordered dictionary of fields for properties used by subjects of type `t`,
+    keyed by (property name, field id, property key) and with the corresponding
+    RDF predicate as value.
+
+    If `fields` is supplied, new fields are added to it, and it is returned.
+    """
+    if fields is None:
+        fields = collections.OrderedDict()
+    if index is None:
+        index = graph_index(rdf)
+    seen = set()
+    for s in index.subjects(t):
+        for p in sorted(index.predicates(s) - seen):
+            pn, pf, pk = property_name_field_key(rdf, p)
+            if (pn, pf, pk) not in fields:
+                fields[(pn, pf, pk)] = p
+            seen.add(p)
+    return fields
+
+def export_view(rdf, t, td, colldir, fields=None):
+    """
+    Export Annalist view description for type `t`, and field descriptions
+    for the properties used.
+
+    If `fields` is not supplied, the view fields are determined from the
+    subjects of type `t` in the supplied graph (see get_view_fields).
     """
     typename = td['annal:id']
     viewname = td["annal:type_view"]
@@ -256,23 +749,17 @@ def export_view(rdf, t, td, colldir):
             }
           ]
         })
-    fields_to_export = set()
-    for s in rdf.subjects(RDF.type, t):
-        for p in sorted(set(rdf.predicates(s, None))):
-            if p != RDF.type:
-                pn, pf, pk = property_name_field_key(rdf, p)
-                if (pn, pf, pk) not in fields_to_export:
-                    # Not already seen for this view: add new field to view
-                    vd["annal:view_fields"].append(
-                        { "annal:field_id":             pf
-                        , "annal:field_placement":      "small:0,12"
-                        })
-                    fields_to_export.add((pn, pf, pk))
+    if fields is None:
+        fields = get_view_fields(rdf, t)
+    for pn, pf, pk in fields:
+        vd["annal:view_fields"].append(
+            { "annal:field_id":             pf
+            , "annal:field_placement":      "small:0,12"
+            })
     vf = os.path.join(colldir, "_annalist_collection/views/%s/view_meta.jsonld"%viewname)
     export_entity(vf, vd)
-    for pn, pf, pk in fields_to_export:
+    for (pn, pf, pk), p in fields.items():
         export_field(rdf, p, pn, pf, pk, colldir)
-    export_field(rdf, RDF.type, "RDF type", "RDF_type", "rdf:type", colldir)
     export_field(rdf, RDF.type, "RDF type", "RDF_type", "annal:type", colldir)
     export_field(rdf, RDFS.seeAlso, "See", "RDF_link", "rdfs:seeAlso", colldir, render="URILink")
     return
@@ -304,7 +791,13 @@ def export_subject(rdf, t, td, s, sd, colldir):
     typename = td['annal:id']
     typeuri  = td['annal:uri']
     subjname = sd['annal:id']
-    sf = os.path.join(colldir, "d/%s/%s/entity-data.jsonld"%(typename, subjname))
+    typedir  = os.path.join(colldir, "d", typename)
+    sf = os.path.join(
+        _entity_layout.entity_dir(typedir, typename, subjname), "entity-data.jsonld"
+        )
+    if _entity_layout.is_sharded(typename) and typename not in _shard_maps:
+        _shard_maps.add(typename)
+        export_entity(os.path.join(typedir, SHARD_MAP_NAME), _entity_layout.shard_map())
     ed = sd.copy()
     ed.update(
         { "@id":              "./"
@@ -315,29 +808,562 @@ def export_subject(rdf, t, td, s, sd, colldir):
     export_entity(sf, ed)
     return
 
-def export_annalist_metadata_from_graph(rdf, colldir):
-    for t in sorted(set(rdf.objects(None, RDF.type))):
+def collect_annalist_metadata(rdf, metadata=None, index=None):
+    """
+    Collect type and field information from a graph, for later export as
+    Annalist type, list, view and field descriptions.
+
+    Returns a dictionary keyed by type URI, where each value is a pair
+    (type info, view fields).  If `metadata` is supplied, information from
+    the graph is added to it, so metadata can be accumulated over several
+    graphs.
+    """
+    if metadata is None:
+        metadata = {}
+    if index is None:
+        index = graph_index(rdf)
+    for t in index.types():
         if not str(t).startswith(str(RDF)):
-            print("Type: %s, export metadata"%t)
-            td = get_type_info(rdf, t)
-            export_type(rdf, t, td, colldir)
-            export_list(rdf, t, td, colldir)
-            export_view(rdf, t, td, colldir)
+            collect_annalist_type_metadata(rdf, t, metadata, index=index)
+    return metadata
+
+def collect_annalist_type_metadata(rdf, t, metadata, index=None):
+    """
+    Collect type and field information for a single type `t` into `metadata`
+    (see collect_annalist_metadata).
+    """
+    if index is None:
+        index = graph_index(rdf)
+    if t not in metadata:
+        metadata[t] = (get_type_info_indexed(rdf, t, index), collections.OrderedDict())
+    td, fields = metadata[t]
+    get_view_fields(rdf, t, fields=fields, index=index)
+    return metadata
+
+def merge_annalist_metadata(metadata, more):
+    """
+    Merge metadata collected from separate graphs or partitions into `metadata`.
+
+    Where a type appears in both, the type information already in `metadata` is
+    kept, and any fields not already present are appended to its view fields.
+    """
+    for t in more:
+        td, fields = more[t]
+        if t not in metadata:
+            metadata[t] = (td, collections.OrderedDict())
+        mfields = metadata[t][1]
+        for k, p in fields.items():
+            if k not in mfields:
+                mfields[k] = p
+    return metadata
+
+def metadata_to_json(metadata):
+    """
+    Return metadata returned by collect_annalist_metadata as a JSON-serializable value
+    """
+    return (
+        [ [ t, td, [ [pn, pf, pk, p] for (pn, pf, pk), p in fields.items() ] ]
+          for t, (td, fields) in metadata.items()
+        ])
+
+def metadata_from_json(jsondata):
+    """
+    Return metadata from a value returned by metadata_to_json
+    """
+    metadata = {}
+    for t, td, fields in jsondata:
+        metadata[URIRef(t)] = (
+            td, 
+            collections.OrderedDict(
+                [ ((pn, pf, pk), URIRef(p)) for pn, pf, pk, p in fields ]
+                )
+            )
+    return metadata
+
+def export_annalist_metadata_collected(metadata, colldir):
+    """
+    Export type, list, view and field descriptions from metadata returned by
+    collect_annalist_metadata.
+    """
+    for t in sorted(metadata):
+        print("Type: %s, export metadata"%t)
+        td, fields = metadata[t]
+        export_type(None, t, td, colldir)
+        export_list(None, t, td, colldir)
+        export_view(None, t, td, colldir, fields=fields)
     return wrangle_errors.SUCCESS
 
-def export_annalist_subjects_from_graph(rdf, colldir, get_subject_info=get_subject_info):
-    for t in sorted(set(rdf.objects(None, RDF.type))):
+def export_annalist_metadata_from_graph(rdf, colldir, index=None):
+    metadata = collect_annalist_metadata(rdf, index=index)
+    return export_annalist_metadata_collected(metadata, colldir)
+
+def export_annalist_subjects_from_graph(rdf, colldir, get_subject_info=get_subject_info, index=None):
+    if index is None:
+        index = graph_index(rdf)
+    for t in index.types():
         if not str(t).startswith(str(RDF)):
-            print("Type: %s, export subjects"%t)
-            td = get_type_info(rdf, t)
-            for s in rdf.subjects(RDF.type, t):
-                print("  Subject %s"%(s))
-                sd = get_subject_info(rdf, s)
-                if sd:
-                    print("  Subject %s/%s"%(td['annal:id'], sd['annal:id']))
-                    export_subject(rdf, t, td, s, sd, colldir)
+            export_annalist_subjects_of_type(
+                rdf, t, colldir, get_subject_info=get_subject_info, index=index
+                )
+    return wrangle_errors.SUCCESS
+
+def export_annalist_subjects_of_type(rdf, t, colldir, get_subject_info=get_subject_info, index=None):
+    if index is None:
+        index = graph_index(rdf)
+    print("Type: %s, export subjects"%t)
+    td = get_type_info_indexed(rdf, t, index)
+    for s in index.subjects(t):
+        print("  Subject %s"%(s))
+        sd = get_subject_info(rdf, s, t=t, index=index)
+        if sd:
+            print("  Subject %s/%s"%(td['annal:id'], sd['annal:id']))
+            export_subject(rdf, t, td, s, sd, colldir)
+    return wrangle_errors.SUCCESS
+
+# Summary entity fields for feature series
+FEATURE_SERIES_FIELDS = (
+    [ CALMA.event_type, CALMA.event_count, CALMA.start_time, CALMA.end_time
+    , CALMA.value_dimensions, CALMA.feature_format, CALMA.feature_data, CALMA.analysis
+    ])
+
+def feature_data_path(sid):
+    """
+    Return path of feature file (npz) or directory (npy) for the series with
+    entity id `sid`, relative to the collection directory (see
+    feature_series.serialize).
+    """
+    if _feature_store == "npz":
+        return "%s/%s.npz"%(FEATURE_DIR, sid)
+    return "%s/%s/"%(FEATURE_DIR, sid)
+
+def get_feature_series_info(rdf, fs):
+    """
+    Extract summary information about a feature series, including the path of
+    its feature data (see feature_data_path).
+    """
+    tname = rdf.namespace_manager.compute_qname(fs.event_type)[2]
+    rule  = FEATURE_SERIES_ID_RULES.rule_for_type(CALMA.FeatureSeries)
+    eid   = rule.entity_id(fs.source, tname)
+    vals  = { "prefix": "", "name": tname, "uri": fs.source, "id": eid }
+    sd = (
+        { "annal:uri":        "%s#%s"%(fs.source, tname)
+        , "annal:id":         eid
+        , "rdfs:label":       "%s series (%d events)"%(tname, fs.count())
+        , "rdfs:comment":     rule.comment_format%vals
+        , "rdfs:seeAlso":     str(fs.source)
+        })
+    values = (
+        [ str(fs.event_type), str(fs.count()), str(fs.start()), str(fs.end())
+        , str(fs.dimensions()), _feature_store, feature_data_path(eid), str(fs.source)
+        ])
+    for p, v in zip(FEATURE_SERIES_FIELDS, values):
+        pn, pf, pk = property_name_field_key(rdf, p)
+        sd[pk] = v
+    return sd
+
+def export_feature_series(rdf, colldir, index, metadata):
+    """
+    With --feature-store, save event series from an analysis graph as NumPy
+    array files in the collection's features directory, and export a summary
+    entity for each series in place of an entity for each event (see
+    feature_store).
+
+    Types whose subjects are all saved in series are removed from the supplied
+    graph index, so that they are skipped when exporting metadata and subjects
+    from the graph, and metadata for the summary entities is added to `metadata`.
+    """
+    if not _feature_store:
+        return wrangle_errors.SUCCESS
+    series, types = extract_feature_series(rdf, index)
+    for t in types:
+        index.remove_type(t)
+    if not series:
+        return wrangle_errors.SUCCESS
+    rdf.namespace_manager.bind("calma", CALMA, override=False)
+    t  = CALMA.FeatureSeries
+    td = get_type_info(rdf, t)
+    fields = collections.OrderedDict(
+        [ (property_name_field_key(rdf, p), p) for p in FEATURE_SERIES_FIELDS ]
+        )
+    merge_annalist_metadata(metadata, { t: (td, fields) })
+    print("Type: %s, export feature series"%t)
+    for fs in series:
+        sd = get_feature_series_info(rdf, fs)
+        print("  Series %s/%s: %d events"%(td['annal:id'], sd['annal:id'], fs.count()))
+        for filename, data in fs.serialize(_feature_store, sd['annal:id']):
+            export_file(os.path.join(colldir, FEATURE_DIR, filename), data)
+        export_subject(rdf, t, td, None, sd, colldir)
     return wrangle_errors.SUCCESS
 
+def export_process_pool(processes):
+    """
+    Return a pool of export worker processes.
+
+    Idle HTTP connections are closed first, so that worker processes do not
+    inherit sockets that are shared with this process and with each other
+    (see HttpConnectionPool), and queued file writes are completed, so that
+    the writer is idle when its state is copied to the worker processes.
+    Any write errors are reported when the export ends.
+    """
+    get_connection_pool().close()
+    _export_writer.wait()
+    return multiprocessing.Pool(processes)
+
+# Graph and index shared with export worker processes, which inherit them when forked.
+_export_graph = None
+_export_index = None
+
+def _export_type_worker(args):
+    """
+    Worker process function: export subjects of a single type from the shared
+    graph, and return the type's metadata.
+    """
+    (t, colldir, get_subject_info) = args
+    export_manifest_counts()
+    metadata = collect_annalist_type_metadata(_export_graph, t, {}, index=_export_index)
+    export_annalist_subjects_of_type(
+        _export_graph, t, colldir, get_subject_info=get_subject_info, index=_export_index
+        )
+    status = flush_export()
+    return (status, metadata, export_manifest_updates(), export_manifest_counts())
+
+def export_annalist_from_graph_parallel(rdf, colldir, processes, get_subject_info=get_subject_info):
+    """
+    Export metadata and subjects from a graph, using a pool of worker processes
+    that each handle all subjects of a given type.
+
+    Metadata from the workers is merged and exported by the calling process,
+    so that type, view and field descriptions are each written just once.
+    """
+    global _export_graph, _export_index
+    index    = graph_index(rdf)
+    metadata = {}
+    status   = export_feature_series(rdf, colldir, index, metadata)
+    if status != wrangle_errors.SUCCESS:
+        return status
+    types = [ t for t in index.types() if not str(t).startswith(str(RDF)) ]
+    # Largest types first, so they do not hold up completion
+    types.sort(key=lambda t: (-len(index.subjects(t)), t))
+    _export_graph = rdf
+    _export_index = index
+    pool = export_process_pool(processes)
+    try:
+        results = pool.map(
+            _export_type_worker, [ (t, colldir, get_subject_info) for t in types ], 
+            chunksize=1
+            )
+    finally:
+        pool.close()
+        pool.join()
+        _export_graph = None
+        _export_index = None
+    for status, m, updates, counts in results:
+        merge_export_manifest_updates(None, counts)
+        if status != wrangle_errors.SUCCESS:
+            return status
+        merge_annalist_metadata(metadata, m)
+        merge_export_manifest_updates(updates)
+    return export_annalist_metadata_collected(metadata, colldir)
+
+def export_analysis_item(aurl, colldir, progress=None, extra=None):
+    """
+    Read a single analysis, export its subjects, and return its metadata.
+    Listing data for the analysis returned by split_listing, if supplied as
+    `extra`, is exported with the analysis.
+
+    Returns (status, stage, error, metadata, updates), where stage is the last
+    stage completed ("pending", "fetched", "parsed" or "exported"), error is a
+    message describing any failure, and updates are the export manifest updates
+    for files written for this analysis.  `progress` is as for fetch_rdf.
+
+    An exception raised while reading or exporting the analysis is reported as
+    a failure, so that other analyses can still be exported (and the failure
+    journalled and retried, see export_analyses_retrying).
+    """
+    print("CALMA analysis URL %s"%aurl)
+    export_manifest_updates(recent=True)
+    stage = ["pending"]
+    def record_stage(s):
+        stage[0] = s
+        if progress:
+            progress(s)
+        return
+    try:
+        return _export_analysis_item(aurl, colldir, stage, record_stage, extra)
+    except Exception as e:
+        error  = "Export failed: %s: %s"%(type(e).__name__, e)
+        status = wrangle_report(wrangle_errors.EXPORTFAIL, "%s (%s)"%(error, aurl))
+        return (status, stage[0], error, None, None)
+
+def _export_analysis_item(aurl, colldir, stage, record_stage, extra):
+    (httpstatus, reason, ardf) = fetch_rdf(aurl, progress=record_stage)
+    if httpstatus != 200:
+        error  = "HTTP error response %03d %s"%(httpstatus, reason)
+        status = wrangle_report(wrangle_errors.HTTPFAIL, "%s (%s)"%(error, aurl))
+        return (status, stage[0], error, None, None)
+    add_listing_data(ardf, extra)
+    index    = graph_index(ardf)
+    metadata = {}
+    status   = export_feature_series(ardf, colldir, index, metadata)
+    if status == wrangle_errors.SUCCESS:
+        collect_annalist_metadata(ardf, metadata=metadata, index=index)
+        status = export_annalist_subjects_from_graph(
+            ardf, colldir, 
+            get_subject_info=get_activity_info, index=index
+            )
+    if status == wrangle_errors.SUCCESS:
+        status = flush_export()
+    if status != wrangle_errors.SUCCESS:
+        return (status, stage[0], "Export failed, status %d"%status, None, None)
+    return (status, "exported", None, metadata, export_manifest_updates(recent=True))
+
+def _export_analysis_worker(args):
+    """
+    Worker process function: read a single analysis, export its subjects, and
+    return its result (see export_analysis_item), the counts of files checked
+    for incremental export (see export_manifest_counts) and the cache usage
+    counts (see cache_counts).
+    """
+    (aurl, colldir, extra) = args
+    export_manifest_counts()
+    caches = cache_counts()
+    result = export_analysis_item(aurl, colldir, extra=extra)
+    return (result, export_manifest_counts(), cache_counts(since=caches))
+
+def export_analyses_parallel(rdf, aurls, colldir, processes):
+    """
+    Export subject data for the supplied analyses listing graph, and use a pool
+    of worker processes to read and export each of the referenced analyses.
+
+    Metadata from the workers is merged in analysis URL order and exported
+    by the calling process.  Listing data about each analysis's subjects is
+    exported with the analysis (see split_listing).
+    """
+    extra    = split_listing(rdf, aurls)
+    index    = graph_index(rdf)
+    metadata = collect_annalist_metadata(rdf, index=index)
+    status   = export_annalist_subjects_from_graph(
+        rdf, colldir, 
+        get_subject_info=get_activity_info, index=index
+        )
+    if status != wrangle_errors.SUCCESS:
+        return status
+    pool = export_process_pool(processes)
+    try:
+        results = pool.map(
+            _export_analysis_worker, [ (aurl, colldir, extra.get(aurl, None)) for aurl in aurls ], 
+            chunksize=1
+            )
+    finally:
+        pool.close()
+        pool.join()
+    for (status, stage, error, m, updates), counts, caches in results:
+        merge_export_manifest_updates(None, counts)
+        merge_cache_counts(caches)
+        if status != wrangle_errors.SUCCESS:
+            return status
+        merge_annalist_metadata(metadata, m)
+        merge_export_manifest_updates(updates)
+    return export_annalist_metadata_collected(metadata, colldir)
+
+def export_analyses_journalled(rdf, aurls, colldir, options):
+    """
+    Export subject data for the supplied analyses listing graph and for each of
+    the referenced analyses, recording progress in a journal (see export_journal)
+    so that an interrupted or partly failed export can be resumed.
+
+    See export_analyses_retrying for details.  Listing data about each
+    analysis's subjects is exported with the analysis (see split_listing).
+    """
+    extra    = split_listing(rdf, aurls)
+    index    = graph_index(rdf)
+    metadata = collect_annalist_metadata(rdf, index=index)
+    status   = export_annalist_subjects_from_graph(
+        rdf, colldir, 
+        get_subject_info=get_activity_info, index=index
+        )
+    if status != wrangle_errors.SUCCESS:
+        return status
+    return export_analyses_retrying(aurls, colldir, options, metadata, extra=extra)
+
+def export_analyses_retrying(aurls, colldir, options, metadata, extra=None):
+    """
+    Export subject data for each of the supplied analyses, then export metadata
+    for all of them, merged into the supplied `metadata`.
+
+    Analyses that cannot be read or exported are retried up to `options.retries`
+    times, with a delay that doubles for each retry.  Metadata for all analyses
+    exported is then exported, and any analyses that still could not be exported
+    are reported.
+
+    If `options.journal` names a journal file, progress is recorded in it, and
+    analyses that the journal records as exported are skipped, using the metadata
+    saved for them.
+
+    Listing data for each analysis returned by split_listing, if supplied as
+    `extra`, is exported with the analysis.
+
+    If `options.processes` is greater than 1, analyses are handled by a pool of
+    worker processes; otherwise, if `options.jobs` is greater than 1, they are
+    handled by a scheduler with that many worker threads (see _export_analyses_map).
+    """
+    journal  = export_journal(options.journal) if options.journal else None
+    results  = {}
+    failures = {}
+    pending  = []
+    try:
+        for aurl in aurls:
+            entry = journal.entry(aurl) if journal else None
+            if entry and entry["state"] == "exported":
+                results[aurl] = (metadata_from_json(entry["metadata"]), entry["manifest"])
+            else:
+                pending.append(aurl)
+        if results:
+            print("Resuming export: %d of %d analyses already exported"%(len(results), len(aurls)))
+        delay = options.retry_delay
+        for attempt in range(options.retries+1):
+            if not pending:
+                break
+            if attempt > 0:
+                print("Retrying %d analyses in %g seconds"%(len(pending), delay))
+                time.sleep(delay)
+                delay *= 2
+            failed = []
+            for aurl, (status, stage, error, m, updates) in _export_analyses_map(
+                    pending, colldir, options, journal, extra or {}
+                    ):
+                if status == wrangle_errors.SUCCESS:
+                    if journal:
+                        journal.exported(aurl, metadata=metadata_to_json(m), manifest=updates)
+                    results[aurl] = (m, updates)
+                else:
+                    attempts = journal.failed(aurl, stage, error) if journal else attempt+1
+                    failures[aurl] = (error, attempts)
+                    failed.append(aurl)
+            pending = failed
+        # Merge metadata in analysis URL order, regardless of when each was exported
+        for aurl in aurls:
+            if aurl in results:
+                m, updates = results[aurl]
+                merge_annalist_metadata(metadata, m)
+                merge_export_manifest_updates(updates)
+        status = export_annalist_metadata_collected(metadata, colldir)
+    finally:
+        if journal:
+            journal.close()
+    if pending:
+        for aurl in sorted(pending):
+            print("Analysis not exported: %s (%s, after %d attempts)"%
+                ((aurl,)+failures[aurl])
+                )
+        return wrangle_report(wrangle_errors.HTTPFAIL,
+            "%d of %d analyses not exported%s"%
+              ( len(pending), len(aurls), 
+                ": use --journal %s to resume"%options.journal if journal else ""
+              )
+            )
+    return status
+
+def _export_analyses_map(aurls, colldir, options, journal, extra):
+    """
+    Export each of the supplied analyses, using a pool of worker processes if
+    `options.processes` is greater than 1, or a scheduler with `options.jobs`
+    worker threads and at most `options.per_host` jobs for any one host if
+    `options.jobs` is greater than 1.
+
+    Yields (analysis URL, result) pairs, where each result is as returned by
+    export_analysis_item, as each analysis is completed, so that its outcome can
+    be recorded before later analyses are processed.
+    """
+    if options.processes > 1:
+        pool = export_process_pool(options.processes)
+        try:
+            results = pool.imap(
+                _export_analysis_worker, [ (aurl, colldir, extra.get(aurl, None)) for aurl in aurls ]
+                )
+            for aurl in aurls:
+                result, counts, caches = results.next()
+                merge_export_manifest_updates(None, counts)
+                merge_cache_counts(caches)
+                yield (aurl, result)
+        finally:
+            pool.close()
+            pool.join()
+        return
+    def export_item(aurl):
+        def progress(stage):
+            if journal:
+                journal.record(aurl, stage)
+            return
+        return export_analysis_item(
+            aurl, colldir, progress=progress, extra=extra.get(aurl, None)
+            )
+    if options.jobs > 1:
+        scheduler = HTTP_Scheduler(max_in_flight=options.jobs, max_per_host=options.per_host)
+        for aurl, result in scheduler.imap_unordered(export_item, aurls):
+            yield (aurl, result)
+        return
+    for aurl in aurls:
+        yield (aurl, export_item(aurl))
+    return
+
+def export_batch(srcroot, userhome, userconfig, options):
+    """
+    Read a list of analyses listing URLs (one for each track) from the file named
+    on the command line, or from standard input, and export data for all analyses
+    of all of the listed tracks.  Local files and directories may also be listed
+    (see listing_sources).
+
+    With --jobs N, listings and analyses are read and exported by N worker
+    threads, with at most --per-host jobs for any one host, sharing the
+    process-wide HTTP connection pool and caches.  Failed analyses are retried,
+    and --journal can be used as for export_multiple_analyses.
+    """
+    if len(options.args) > 1:
+        return wrangle_unexpected(options)
+    listfile = options.args[0] if options.args else None
+    try:
+        sources = getargvaluelist(listfile)
+    except IOError as e:
+        return wrangle_report(wrangle_errors.BADCMD,
+            "Cannot read list of analyses URLs from %s: %s"%(listfile, e.strerror or e)
+            )
+    urls = []
+    for src in sources:
+        urls.extend(listing_sources(src))
+    if not urls:
+        return wrangle_missingarg("analyses URL", options)
+    colldir   = collection_dir()
+    scheduler = HTTP_Scheduler(max_in_flight=options.jobs, max_per_host=options.per_host)
+    listings  = scheduler.map(fetch_rdf, urls)
+    metadata  = {}
+    aurls     = []
+    extra     = {}
+    status    = wrangle_errors.SUCCESS
+    for url, (httpstatus, reason, rdf) in zip(urls, listings):
+        print("CALMA analyses URL %s"%url)
+        if httpstatus != 200:
+            status = wrangle_report(
+                wrangle_errors.HTTPFAIL,
+                "HTTP error response %03d %s (%s)"%(httpstatus, reason, url)
+                )
+            continue
+        laurls = sorted([ str(a) for a in rdf.subjects(RDF.type, PROV.Activity) ])
+        for aurl, (namespaces, triples) in split_listing(rdf, laurls).items():
+            extra.setdefault(aurl, (namespaces, []))[1].extend(triples)
+        index = graph_index(rdf)
+        collect_annalist_metadata(rdf, metadata=metadata, index=index)
+        export_annalist_subjects_from_graph(
+            rdf, colldir, 
+            get_subject_info=get_activity_info, index=index
+            )
+        for aurl in laurls:
+            if aurl not in aurls:
+                aurls.append(aurl)
+    print("Batch: %d tracks, %d analyses"%(len(urls), len(aurls)))
+    astatus = export_analyses_retrying(aurls, colldir, options, metadata, extra=extra)
+    return status if status != wrangle_errors.SUCCESS else astatus
+
 def export_annalist_metadata(srcroot, userhome, userconfig, options):
     """
     Read CALMA analysis data at URI supplied on command line
@@ -350,11 +1376,11 @@ def export_annalist_metadata(srcroot, userhome, userconfig, options):
         return wrangle_missingarg("analysis URL", options)
     url    = options.args[0]
     print("CALMA analysis URL %s"%url)
-    status, rdf = read_rdf(url)
+    status, rdf = read_rdf_source(url)
     if status != wrangle_errors.SUCCESS:
         return status
     # Poke around data and show some information
-    colldir = os.path.join(os.path.expanduser("~"), "annalist_site/c/CALMA_data")
+    colldir = collection_dir()
     status  = export_annalist_metadata_from_graph(rdf, colldir)
     return status
 
@@ -370,11 +1396,11 @@ def export_annalist_subjects(srcroot, userhome, userconfig, options):
         return wrangle_missingarg("analysis URL", options)
     url    = options.args[0]
     print("CALMA analysis URL %s"%url)
-    status, rdf = read_rdf(url)
+    status, rdf = read_rdf_source(url)
     if status != wrangle_errors.SUCCESS:
         return status
     # Poke around data and show some information
-    colldir = os.path.join(os.path.expanduser("~"), "annalist_site/c/CALMA_data")
+    colldir = collection_dir()
     status  = export_annalist_subjects_from_graph(rdf, colldir)
     return status
 
@@ -390,15 +1416,23 @@ def export_analysis(srcroot, userhome, userconfig, options):
         return wrangle_missingarg("analysis URL", options)
     url    = options.args[0]
     print("CALMA analysis URL %s"%url)
-    status, rdf = read_rdf(url)
+    status, rdf = read_rdf_source(url)
     if status != wrangle_errors.SUCCESS:
         return status
     # Poke around data and show some information
-    colldir = os.path.join(os.path.expanduser("~"), "annalist_site/c/CALMA_data")
-    status  = export_annalist_metadata_from_graph(rdf, colldir)
+    colldir = collection_dir()
+    if options.processes > 1:
+        return export_annalist_from_graph_parallel(rdf, colldir, options.processes)
+    index    = graph_index(rdf)
+    metadata = {}
+    status   = export_feature_series(rdf, colldir, index, metadata)
     if status != wrangle_errors.SUCCESS:
         return status
-    status  = export_annalist_subjects_from_graph(rdf, colldir)
+    collect_annalist_metadata(rdf, metadata=metadata, index=index)
+    status  = export_annalist_metadata_collected(metadata, colldir)
+    if status != wrangle_errors.SUCCESS:
+        return status
+    status  = export_annalist_subjects_from_graph(rdf, colldir, index=index)
     if status != wrangle_errors.SUCCESS:
         return status
     return status
@@ -414,29 +1448,156 @@ def export_analyses_multiple(srcroot, userhome, userconfig, options):
         return wrangle_missingarg("analyses URL", options)
     url    = options.args[0]
     print("CALMA analyses URL %s"%url)
-    status, rdf = read_rdf(url)
+    status, rdf = read_rdf_multiple(listing_sources(url))
     if status != wrangle_errors.SUCCESS:
         return status
     # print("  len(rdf) = %d"%len(rdf))
+    colldir = collection_dir()
+    aurls   = sorted([ str(a) for a in rdf.subjects(RDF.type, PROV.Activity) ])
+    if options.journal:
+        return export_analyses_journalled(rdf, aurls, colldir, options)
+    if options.processes > 1 and options.partition == "analysis":
+        return export_analyses_parallel(rdf, aurls, colldir, options.processes)
+    if options.stream:
+        return export_analyses_streaming(rdf, aurls, colldir)
     # Read referenced analyses and import data to graph
-    for a in rdf.subjects(RDF.type, PROV.Activity):
-        aurl = str(a)
-        print("CALMA analysis URL %s"%aurl)
-        status, rdf = read_rdf(aurl, graph=rdf)
-        if status != wrangle_errors.SUCCESS:
-            return status
-        # print("  len(rdf) = %d"%len(rdf))
+    status, rdf = read_rdf_multiple(
+        aurls, graph=rdf, jobs=options.jobs, async_fetch=options.async_fetch
+        )
+    if status != wrangle_errors.SUCCESS:
+        return status
+    # print("  len(rdf) = %d"%len(rdf))
     # Generate metadata and subject data
-    colldir = os.path.join(os.path.expanduser("~"), "annalist_site/c/CALMA_data")
-    status  = export_annalist_metadata_from_graph(rdf, colldir)
+    if options.processes > 1:
+        return export_annalist_from_graph_parallel(
+            rdf, colldir, options.processes, 
+            get_subject_info=get_activity_info
+            )
+    index    = graph_index(rdf)
+    metadata = {}
+    status   = export_feature_series(rdf, colldir, index, metadata)
+    if status != wrangle_errors.SUCCESS:
+        return status
+    collect_annalist_metadata(rdf, metadata=metadata, index=index)
+    status  = export_annalist_metadata_collected(metadata, colldir)
     if status != wrangle_errors.SUCCESS:
         return status
     status  = export_annalist_subjects_from_graph(
         rdf, colldir, 
-        get_subject_info=get_activity_info
+        get_subject_info=get_activity_info, index=index
         )
     if status != wrangle_errors.SUCCESS:
         return status
     return status
 
+def explode_bundle(srcroot, userhome, userconfig, options):
+    """
+    Unpack an export bundle file named on the command line into the Annalist
+    collection directory.
+    """
+    if len(options.args) > 1:
+        return wrangle_unexpected(options)
+    if len(options.args) == 0:
+        return wrangle_missingarg("bundle file", options)
+    bundle  = options.args[0]
+    print("Export bundle %s"%bundle)
+    colldir = collection_dir()
+    for path, data in read_bundle(bundle):
+        ef = os.path.normpath(os.path.join(colldir, path))
+        if not ef.startswith(colldir+os.sep):
+            return wrangle_report(wrangle_errors.BADBUNDLE,
+                "Bundle %s: invalid file path %s"%(bundle, path)
+                )
+        export_file(ef, data)
+    return wrangle_errors.SUCCESS
+
+def split_listing(rdf, aurls):
+    """
+    Remove from analyses listing graph `rdf` the descriptions of subjects that
+    belong to the documents of the analyses `aurls` (e.g. each analysis's
+    prov:Activity), including any blank nodes that they refer to.
+
+    Returns a dictionary, keyed by analysis URL, of (namespaces, triples) pairs,
+    where namespaces are the listing's namespace prefix bindings and triples are
+    those removed.  When analyses are exported from separate graphs, these are
+    added to the graph for the corresponding analysis (see add_listing_data), so
+    that each subject is exported just once, with all of the properties that it
+    would have if the listing and analyses were read into a single graph.
+    """
+    documents = {}
+    for aurl in aurls:
+        documents.setdefault(subject_document(aurl), aurl)
+    namespaces = list(rdf.namespaces())
+    extra      = {}
+    for s in sorted(set(rdf.subjects())):
+        if not isinstance(s, URIRef) or subject_document(s) not in documents:
+            continue
+        triples = extra.setdefault(documents[subject_document(s)], (namespaces, []))[1]
+        nodes   = [s]
+        seen    = set(nodes)
+        while nodes:
+            for t in rdf.triples((nodes.pop(), None, None)):
+                triples.append(t)
+                if isinstance(t[2], BNode) and t[2] not in seen:
+                    seen.add(t[2])
+                    nodes.append(t[2])
+    for namespaces, triples in extra.values():
+        for t in triples:
+            rdf.remove(t)
+    return extra
+
+def add_listing_data(ardf, extra):
+    """
+    Add listing data for an analysis, returned by split_listing, to the graph
+    read for the analysis.  Namespace prefixes already bound in the analysis
+    graph are kept.
+    """
+    if extra:
+        namespaces, triples = extra
+        for prefix, namespace in namespaces:
+            ardf.bind(prefix, namespace, override=False)
+        for t in triples:
+            ardf.add(t)
+    return ardf
+
+def export_analyses_streaming(rdf, aurls, colldir):
+    """
+    Export subject data for the supplied analyses listing graph and for each of the
+    referenced analyses in turn, then export metadata for all of them.
+
+    Each analysis is read into a separate graph, which is discarded once its
+    subjects have been exported, so that memory used is determined by the largest
+    single analysis rather than by all of the analyses for a track.  Listing data
+    about an analysis's subjects is exported with the analysis (see split_listing).
+    """
+    extra    = split_listing(rdf, aurls)
+    index    = graph_index(rdf)
+    metadata = collect_annalist_metadata(rdf, index=index)
+    status   = export_annalist_subjects_from_graph(
+        rdf, colldir, 
+        get_subject_info=get_activity_info, index=index
+        )
+    if status != wrangle_errors.SUCCESS:
+        return status
+    for aurl in aurls:
+        print("CALMA analysis URL %s"%aurl)
+        status, ardf = read_rdf(aurl)
+        if status != wrangle_errors.SUCCESS:
+            return status
+        add_listing_data(ardf, extra.get(aurl, None))
+        index  = graph_index(ardf)
+        status = export_feature_series(ardf, colldir, index, metadata)
+        if status != wrangle_errors.SUCCESS:
+            return status
+        collect_annalist_metadata(ardf, metadata=metadata, index=index)
+        status = export_annalist_subjects_from_graph(
+            ardf, colldir, 
+            get_subject_info=get_activity_info, index=index
+            )
+        if status != wrangle_errors.SUCCESS:
+            return status
+        ardf  = None
+        index = None
+    return export_annalist_metadata_collected(metadata, colldir)
+
 # End.
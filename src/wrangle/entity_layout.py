@@ -0,0 +1,86 @@
+"""
+Directory layout for exported Annalist entities.
+
+By default, each entity is exported to `d/<type_id>/<entity_id>/`, so that all
+entities of a type are in a single directory.  For event-heavy types this can
+mean tens of thousands of entries in one directory, which makes lookups and
+listings slow on some file systems.  A sharded layout places each entity in
+one of a fixed number of shard directories, chosen by a hash of the entity id:
+
+    d/<type_id>/<shard>/<entity_id>/
+
+A shard map file in each sharded type directory describes the layout, so that
+other tools can locate entities (see `entity_layout.entity_dir`).
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import hashlib
+
+SHARD_MAP_NAME = "_entity_shards.json"
+
+class entity_layout(object):
+
+    """
+    Entity directory layout.
+
+    fanout          number of shard directories per type, or 0 for the flat layout.
+    types           if not None, a collection of type ids to which the sharded
+                    layout is applied; other types use the flat layout.
+    """
+
+    def __init__(self, fanout=0, types=None):
+        self._fanout = fanout
+        self._types  = frozenset(types) if types is not None else None
+        self._digits = len("%x"%(fanout-1)) if fanout > 1 else 1
+        return
+
+    @classmethod
+    def from_shard_map(cls, shard_map):
+        """
+        Return layout described by the content of a shard map file (see `shard_map`)
+        """
+        return cls(fanout=shard_map["fanout"])
+
+    def is_sharded(self, type_id):
+        """
+        Return True if entities of the indicated type use the sharded layout
+        """
+        return self._fanout > 0 and (self._types is None or type_id in self._types)
+
+    def shard(self, entity_id):
+        """
+        Return shard directory name for an entity id
+        """
+        if isinstance(entity_id, unicode):
+            entity_id = entity_id.encode("utf-8")
+        h = int(hashlib.sha1(entity_id).hexdigest()[0:8], 16)
+        return "%0*x"%(self._digits, h % self._fanout)
+
+    def entity_dir(self, typedir, type_id, entity_id):
+        """
+        Return directory for an entity, given the directory for its type
+        """
+        if self.is_sharded(type_id):
+            return os.path.join(typedir, self.shard(entity_id), entity_id)
+        return os.path.join(typedir, entity_id)
+
+    def shard_map(self):
+        """
+        Return shard map describing this layout, for saving in a sharded type
+        directory.
+        """
+        return (
+            { "fanout":     self._fanout
+            , "hash":       "sha1"
+            , "shard":      "first 8 hex digits of sha1(entity_id) modulo fanout, "+
+                            "as %d lower case hex digits"%self._digits
+            , "path":       "<shard>/<entity_id>"
+            })
+
+# End.
@@ -0,0 +1,154 @@
+"""
+Single-file bundles of exported Annalist collection files.
+
+Exporting a large corpus as one small file per entity creates a very large
+number of files and directories, and creating them dominates export time.  A
+bundle holds the same files, identified by their paths relative to the
+collection directory, in a single file that is written sequentially.  A bundle
+can later be unpacked ("exploded") into the Annalist collection layout.
+
+Two bundle formats are supported:
+
+    jsonl   one JSON object per line, with members "path" and "data", where
+            "data" is the exported file content as a string.  Binary content
+            (such as feature arrays) is base64-encoded, and indicated by an
+            additional member "encoding" with value "base64".
+    tar     an uncompressed tar archive.
+
+An `export_bundle` can be used in place of an `export_writer` (see calma_data).
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import json
+import base64
+import time
+import tarfile
+import threading
+import StringIO
+import logging
+
+log = logging.getLogger(__name__)
+
+BUNDLE_FORMATS = ("jsonl", "tar")
+
+def bundle_format(filename):
+    """
+    Return bundle format name for the supplied bundle file name
+    """
+    if filename.endswith(".tar"):
+        return "tar"
+    return "jsonl"
+
+class export_bundle(object):
+
+    """
+    Write exported files to a single bundle file.
+
+    filename        name of bundle file; the bundle is written to a temporary
+                    file, which is renamed when the bundle is closed.
+    colldir         collection directory; files are recorded in the bundle
+                    with paths relative to this directory.
+    format          bundle format (see BUNDLE_FORMATS); if None, this is
+                    determined from the bundle file name.
+    """
+
+    def __init__(self, filename, colldir, format=None):
+        self._filename  = filename
+        self._tmpname   = filename+".tmp"
+        self._colldir   = colldir
+        self._format    = format or bundle_format(filename)
+        self._lock      = threading.Lock()
+        self._pid       = os.getpid()
+        self.count      = 0
+        if self._format == "tar":
+            self._tar    = tarfile.open(self._tmpname, "w")
+            self._stream = None
+        else:
+            self._tar    = None
+            self._stream = open(self._tmpname, "wb")
+        return
+
+    def write(self, filename, data):
+        """
+        Add data for the named file to the bundle.
+        """
+        if self._pid != os.getpid():
+            raise ValueError("Export bundle %s cannot be written by a worker process"%(self._filename))
+        path = os.path.relpath(filename, self._colldir)
+        with self._lock:
+            if self._tar:
+                info       = tarfile.TarInfo(path)
+                info.size  = len(data)
+                info.mtime = time.time()
+                info.mode  = 0644
+                self._tar.addfile(info, StringIO.StringIO(data))
+            else:
+                try:
+                    record = json.dumps({ "path": path, "data": data })
+                except UnicodeDecodeError:
+                    record = json.dumps(
+                        { "path": path, "data": base64.b64encode(data), "encoding": "base64" }
+                        )
+                self._stream.write(record)
+                self._stream.write("\n")
+            self.count += 1
+        return
+
+    def wait(self):
+        """
+        Write out buffered bundle data, e.g. before forking worker processes.
+        """
+        with self._lock:
+            if self._tar:
+                self._tar.fileobj.flush()
+            else:
+                self._stream.flush()
+        return
+
+    def flush(self):
+        """
+        Bundle writes are synchronous, so there are no pending errors to return.
+        """
+        return []
+
+    def close(self):
+        """
+        Complete the bundle file.
+        """
+        with self._lock:
+            if self._tar:
+                self._tar.close()
+            else:
+                self._stream.close()
+            os.rename(self._tmpname, self._filename)
+        print("Bundle %s: %d files"%(self._filename, self.count))
+        return []
+
+def read_bundle(filename):
+    """
+    Iterate over files in a bundle, returning (path, data) pairs, where path
+    is relative to the collection directory.
+    """
+    if tarfile.is_tarfile(filename):
+        with tarfile.open(filename, "r") as tar:
+            for info in tar:
+                if info.isfile():
+                    yield (info.name, tar.extractfile(info).read())
+    else:
+        with open(filename, "rb") as stream:
+            for line in stream:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get("encoding", None) == "base64":
+                        yield (record["path"], base64.b64decode(record["data"]))
+                    else:
+                        yield (record["path"], record["data"].encode("utf-8"))
+    return
+
+# End.
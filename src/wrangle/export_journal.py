@@ -0,0 +1,135 @@
+"""
+Journal of analysis export progress, used to resume an interrupted crawl.
+
+The journal records the state reached by each analysis URL processed by
+`export_analyses_multiple`:
+
+    fetched     the analysis has been retrieved, but not yet parsed
+    parsed      the analysis has been read, but not yet exported
+    exported    the analysis has been exported
+    failed      processing failed; the entry records the last stage completed
+                ("pending", "fetched" or "parsed"), the error and the number
+                of attempts made
+
+(The intermediate states are recorded only when analyses are processed by the
+process that owns the journal, and show where an interrupted run stopped.)
+
+Entries are appended to the journal file as they are recorded, so progress is
+kept if a run is interrupted.  When the journal is loaded, later entries for a
+URL replace earlier ones, and the journal file is compacted when it is closed.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import json
+import time
+import errno
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+class export_journal(object):
+
+    """
+    Persistent record of per-URL export state.
+
+    filename        name of journal file, which is created if it does not exist.
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._entries  = {}
+        self._lock     = threading.Lock()
+        try:
+            with open(filename, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Ignore incomplete last line from an interrupted run
+                        log.warning("Ignoring invalid journal entry in %s"%(filename))
+                        continue
+                    self._entries[entry["url"]] = entry
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        self._stream = open(filename, "ab")
+        return
+
+    def state(self, url):
+        """
+        Return recorded state for URL, or "pending" if none is recorded
+        """
+        return self._entries.get(url, {}).get("state", "pending")
+
+    def entry(self, url):
+        """
+        Return journal entry for URL, or None
+        """
+        return self._entries.get(url, None)
+
+    def record(self, url, state, **values):
+        """
+        Record new state and associated values for URL.  The number of failed
+        attempts recorded for the URL, if any, is carried over to the new entry.
+        """
+        with self._lock:
+            return self._record(url, state, values)
+
+    def _record(self, url, state, values):
+        # Called with lock held
+        entry = dict(values, url=url, state=state, time=time.time())
+        previous = self._entries.get(url, {})
+        if "attempts" in previous and "attempts" not in entry:
+            entry["attempts"] = previous["attempts"]
+        self._entries[url] = entry
+        self._stream.write(json.dumps(entry, sort_keys=True))
+        self._stream.write("\n")
+        self._stream.flush()
+        return entry
+
+    def exported(self, url, **values):
+        """
+        Record that the analysis at URL has been exported
+        """
+        return self.record(url, "exported", **values)
+
+    def failed(self, url, stage, error):
+        """
+        Record failure to process URL after reaching the indicated stage,
+        and return the number of attempts made.
+        """
+        with self._lock:
+            attempts = self._entries.get(url, {}).get("attempts", 0) + 1
+            self._record(url, "failed", dict(stage=stage, error=error, attempts=attempts))
+        return attempts
+
+    def counts(self):
+        """
+        Return dictionary of the number of URLs in each state
+        """
+        counts = {}
+        for entry in self._entries.values():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
+
+    def close(self):
+        """
+        Close journal, rewriting it with just the latest entry for each URL.
+        """
+        self._stream.close()
+        tmpname = self._filename+".tmp"
+        with open(tmpname, "wb") as f:
+            for url in sorted(self._entries):
+                f.write(json.dumps(self._entries[url], sort_keys=True))
+                f.write("\n")
+        os.rename(tmpname, self._filename)
+        return
+
+# End.
@@ -0,0 +1,185 @@
+"""
+Manifest of exported Annalist collection files, used for incremental export.
+
+The manifest records a content hash for each file written to the collection
+directory.  When an export is repeated, files whose content is unchanged are
+not rewritten, and files recorded by earlier runs that were not produced by
+the current run can be reported as stale, or removed.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import json
+import errno
+import hashlib
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".wrangle_manifest.json"
+
+class export_manifest(object):
+
+    """
+    Content hashes for files in an exported collection.
+
+    colldir         collection directory; the manifest is saved in this directory,
+                    and paths are recorded relative to it.
+    """
+
+    def __init__(self, colldir):
+        self._colldir   = colldir
+        self._filename  = os.path.join(colldir, MANIFEST_NAME)
+        self._lock      = threading.Lock()
+        self._hashes    = {}        # Hashes from previous runs
+        self._current   = {}        # Hashes of files produced by this run
+        self._local     = threading.local()
+        self.written    = 0
+        self.unchanged  = 0
+        try:
+            with open(self._filename, "rb") as f:
+                self._hashes = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except ValueError as e:
+            log.warning("Ignoring invalid export manifest %s: %s"%(self._filename, e))
+        return
+
+    def _recent(self):
+        # Hashes recorded by the current thread since it last called
+        # updates(recent=True)
+        if not hasattr(self._local, "recent"):
+            self._local.recent = {}
+        return self._local.recent
+
+    def _recent_counts(self):
+        # Written and unchanged counts for the current thread since it last
+        # called counts(recent=True)
+        if not hasattr(self._local, "counts"):
+            self._local.counts = [0, 0]
+        return self._local.counts
+
+    def _relpath(self, filename):
+        return os.path.relpath(filename, self._colldir)
+
+    def check(self, filename, data):
+        """
+        Record that `data` is to be exported to `filename`, and return True if the
+        file needs to be written, or False if it is unchanged since the last export.
+        """
+        path   = self._relpath(filename)
+        digest = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            # Compare with content already written by this run, if any
+            previous = self._current.get(path, self._hashes.get(path))
+            self._current[path] = digest
+            self._recent()[path] = digest
+            if previous == digest and os.path.exists(filename):
+                self.unchanged += 1
+                self._recent_counts()[1] += 1
+                return False
+            self.written += 1
+            self._recent_counts()[0] += 1
+        return True
+
+    def updates(self, recent=False):
+        """
+        Return hashes of files produced by this run, e.g. for passing from a
+        worker process to the parent process's manifest (see `merge`).
+
+        If `recent` is True, return just the hashes recorded by the calling thread
+        since its last such call, and start a new set of recent updates.
+        """
+        if recent:
+            updates = self._recent()
+            self._local.recent = {}
+            return updates
+        with self._lock:
+            return dict(self._current)
+
+    def counts(self, recent=False):
+        """
+        Return (written, unchanged) counts of files checked by this run, e.g. for
+        passing from a worker process to the parent process's manifest (see `merge`).
+
+        If `recent` is True, return just the counts for the calling thread since
+        its last such call, and start new counts.
+        """
+        if recent:
+            counts = tuple(self._recent_counts())
+            self._local.counts = [0, 0]
+            return counts
+        with self._lock:
+            return (self.written, self.unchanged)
+
+    def merge(self, updates, counts=None):
+        """
+        Merge hashes of files produced by a worker process, and add the
+        worker's (written, unchanged) counts if supplied.
+        """
+        with self._lock:
+            self._current.update(updates or {})
+            if counts:
+                self.written   += counts[0]
+                self.unchanged += counts[1]
+        return
+
+    def stale(self):
+        """
+        Return sorted list of paths of files recorded by earlier runs that
+        have not been produced by this run.
+        """
+        with self._lock:
+            return sorted(set(self._hashes) - set(self._current))
+
+    def prune(self):
+        """
+        Remove stale files, and any directories left empty.
+
+        Returns the list of paths removed.
+        """
+        removed = []
+        for path in self.stale():
+            filename = os.path.join(self._colldir, path)
+            try:
+                os.remove(filename)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            removed.append(path)
+            # Remove empty parent directories, up to the collection directory
+            dirname = os.path.dirname(filename)
+            while dirname != self._colldir and dirname.startswith(self._colldir):
+                try:
+                    os.rmdir(dirname)
+                except OSError:
+                    break
+                dirname = os.path.dirname(dirname)
+        with self._lock:
+            for path in removed:
+                del self._hashes[path]
+        return removed
+
+    def save(self):
+        """
+        Save manifest, including files from earlier runs that have not been removed.
+        """
+        with self._lock:
+            hashes = dict(self._hashes)
+            hashes.update(self._current)
+        if not os.path.isdir(self._colldir):
+            os.makedirs(self._colldir)
+        tmpname = self._filename+".tmp"
+        with open(tmpname, "wb") as f:
+            json.dump(hashes, f, indent=0, sort_keys=True)
+        os.rename(tmpname, self._filename)
+        return
+
+# End.
@@ -0,0 +1,156 @@
+"""
+Writer for exported Annalist collection files.
+
+Entity data is serialized by the caller, and the resulting file writes are
+queued to a pool of background threads, so that file system I/O overlaps with
+reading and traversing RDF graphs.  Directories known to exist are remembered,
+so each entity directory is created (or checked) just once.
+
+A writer with no threads performs writes synchronously.  Errors from background
+writes are collected, and returned when the writer is flushed at the end of an
+export.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import errno
+import Queue
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+class export_writer(object):
+
+    """
+    Queue file writes to a pool of background threads.
+
+    threads         number of writer threads, or 0 to write synchronously.
+    max_queue       maximum number of writes queued for each thread before the
+                    producer waits.
+    """
+
+    def __init__(self, threads=0, max_queue=1000):
+        self._threads    = threads
+        self._max_queue  = max_queue
+        self._pid        = None
+        self._start()
+        return
+
+    def _start(self):
+        # Also called to restart worker threads in a forked process, as threads
+        # are not inherited by a child process.  The lock is also recreated, as
+        # a lock inherited from the parent may have been held by one of its
+        # threads when the process was forked.
+        self._pid     = os.getpid()
+        self._lock    = threading.Lock()
+        self._dirs    = set()
+        self._errors  = []
+        self._queues  = []
+        self._workers = []
+        for i in range(self._threads):
+            q = Queue.Queue(self._max_queue)
+            w = threading.Thread(target=self._run, args=(q,), name="export_writer_%d"%i)
+            w.daemon = True
+            w.start()
+            self._queues.append(q)
+            self._workers.append(w)
+        return
+
+    def _run(self, queue):
+        while True:
+            item = queue.get()
+            try:
+                if item is None:
+                    return
+                self._write_file(*item)
+            except Exception as e:
+                # Any failure is recorded, so that the thread keeps serving its
+                # queue and a later flush does not wait for it indefinitely.
+                log.debug("export_writer: %s: %s"%(item[0], e))
+                with self._lock:
+                    self._errors.append((item[0], e))
+            finally:
+                queue.task_done()
+        return
+
+    def _makedirs(self, dirname):
+        if dirname in self._dirs:
+            return
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with self._lock:
+            self._dirs.add(dirname)
+        return
+
+    def _write_file(self, filename, data):
+        self._makedirs(os.path.dirname(filename))
+        with open(filename, "wb") as fs:
+            fs.write(data)
+        return
+
+    def write(self, filename, data):
+        """
+        Write data to the named file, creating directories as needed.
+
+        Synchronous writes raise any error directly; errors from queued writes
+        are returned by `flush`.
+        """
+        if self._pid != os.getpid():
+            self._start()
+        if self._threads == 0:
+            self._write_file(filename, data)
+        else:
+            # Writes to a given file are always handled by the same thread, so
+            # they are performed in the order requested.
+            self._queues[hash(filename) % self._threads].put((filename, data))
+        return
+
+    def wait(self):
+        """
+        Wait for all queued writes to complete, e.g. before forking worker
+        processes.  Errors are kept, to be returned by `flush`.
+        """
+        if self._pid != os.getpid():
+            self._start()
+        for q in self._queues:
+            q.join()
+        return
+
+    def flush(self):
+        """
+        Wait for all queued writes to complete.
+
+        Returns a list of (filename, exception) pairs for writes that failed
+        since the last flush.
+        """
+        self.wait()
+        with self._lock:
+            errors       = self._errors
+            self._errors = []
+        return errors
+
+    def close(self):
+        """
+        Flush queued writes and stop writer threads.
+
+        Returns a list of (filename, exception) pairs for writes that failed.
+        """
+        errors = self.flush()
+        for q in self._queues:
+            q.put(None)
+        for w in self._workers:
+            w.join()
+        self._queues  = []
+        self._workers = []
+        return errors
+
+# End.
@@ -0,0 +1,99 @@
+"""
+Multi-resolution summaries of feature series values, for rendering.
+
+Dense frame-level features (chromagrams, onsets, spectral descriptors) have far
+more values than can usefully be displayed.  A pyramid of summaries is built
+for each series with numeric values: level 1 summarizes each pair of events,
+level 2 each pair of level 1 buckets, and so on, halving the number of buckets
+at each level until a single bucket remains.  For each bucket, the pyramid
+holds:
+
+    time    start time of the first event in the bucket.
+    end     latest end time of the events in the bucket.
+    count   number of events in the bucket.
+    min     minimum of each feature value over the events in the bucket.
+    max     maximum of each feature value over the events in the bucket.
+    mean    mean of each feature value over the events in the bucket.
+
+Each level is computed from the level below with vectorized NumPy reductions,
+so building the pyramid costs about the same as a single pass over the values.
+Levels are saved as additional columns of the series (see PYRAMID_COLUMN), and
+a viewer can read just the level that matches the resolution it needs (see
+feature_reader.resolution).
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import collections
+
+import numpy
+
+from interval_index import interval_end
+
+PYRAMID_COLUMN = "pyramid_%d_%s"    # Column name for level and statistic
+
+PYRAMID_STATS  = ("time", "end", "count", "min", "max", "mean")
+
+def pyramid_column(level, stat):
+    """
+    Return name of series column for a statistic at the given pyramid level
+    """
+    return PYRAMID_COLUMN%(level, stat)
+
+def pyramid_levels(time, duration, value):
+    """
+    Return list of pyramid levels for a series with numeric values, where each
+    level is a dictionary of arrays for the statistics in PYRAMID_STATS, with a
+    row for each bucket.  Level 1 is the first element of the list.
+    """
+    n     = len(time)
+    value = value.astype(numpy.float64)
+    level = (
+        { "time":     time
+        , "end":      interval_end(time, duration)
+        , "count":    numpy.ones(n, dtype=numpy.int64)
+        , "min":      value
+        , "max":      value
+        , "sum":      value
+        })
+    levels = []
+    while len(level["time"]) > 1:
+        # Each bucket combines a pair of buckets from the level below
+        pairs = numpy.arange(0, len(level["time"]), 2)
+        level = (
+            { "time":     level["time"][pairs]
+            , "end":      numpy.maximum.reduceat(level["end"], pairs)
+            , "count":    numpy.add.reduceat(level["count"], pairs)
+            , "min":      numpy.minimum.reduceat(level["min"], pairs, axis=0)
+            , "max":      numpy.maximum.reduceat(level["max"], pairs, axis=0)
+            , "sum":      numpy.add.reduceat(level["sum"], pairs, axis=0)
+            })
+        levels.append(level)
+    return levels
+
+def pyramid_columns(time, duration, value):
+    """
+    Return ordered dictionary of series columns for the pyramid of a series
+    with numeric values (see pyramid_column), with min, max and mean values
+    of the same type as the series values.
+    """
+    columns = collections.OrderedDict()
+    for n, level in enumerate(pyramid_levels(time, duration, value), 1):
+        count = level["count"].reshape((-1,) + (1,)*(level["sum"].ndim-1))
+        stats = (
+            { "time":     level["time"]
+            , "end":      level["end"]
+            , "count":    level["count"].astype(numpy.int32)
+            , "min":      level["min"].astype(value.dtype)
+            , "max":      level["max"].astype(value.dtype)
+            , "mean":     (level["sum"] / count).astype(value.dtype)
+            })
+        for stat in PYRAMID_STATS:
+            columns[pyramid_column(n, stat)] = stats[stat]
+    return columns
+
+# End.
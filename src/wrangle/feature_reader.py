@@ -0,0 +1,256 @@
+"""
+Read-only access to feature series exported to an Annalist collection.
+
+Feature series saved by an export with --feature-store (see feature_store) are
+described by small index headers, "features/<series id>.json", which give the
+summary values for each series and the location of each of its column arrays
+within the saved .npz or .npy files.  A `feature_reader` lists series from
+these headers, and maps the array files into memory read-only, so that columns
+and time windows of a series are returned as views of the mapped files without
+reading or copying whole files.
+
+Events that overlap a time range are found using the interval index saved
+with each series (see interval_index), and summaries of feature values at a
+resolution suited to a display are read from the pyramid of summaries saved
+with each series that has numeric values (see feature_pyramid).
+
+Usage:
+
+    reader = feature_reader(colldir)
+    for header in reader.series(track="track_00001237"):
+        print(header["id"], header["event_type"], header["count"])
+    chords = reader.window(series_id, 60.0, 70.0)
+    print(chords["time"], chords["label"])
+    events = reader.overlapping_series(60.0, 70.0, track="track_00001237")
+    level, summary = reader.resolution(series_id, 800)
+    print(summary["time"], summary["min"], summary["max"])
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import os
+import json
+import logging
+
+import numpy
+
+from feature_store  import FEATURE_DIR
+from interval_index  import interval_end, interval_max_end, overlapping_rows
+from feature_pyramid import PYRAMID_STATS, pyramid_column
+
+log = logging.getLogger(__name__)
+
+class feature_reader(object):
+
+    """
+    Reader for feature series in the features directory of a collection.
+
+    colldir         Annalist collection directory to which feature series
+                    were exported.
+    """
+
+    def __init__(self, colldir):
+        self._dirname = os.path.join(colldir, FEATURE_DIR)
+        self._headers = None
+        self._maps    = {}          # filename -> memory-mapped file content
+        self._columns = {}          # (series id, column name) -> array view
+        return
+
+    def _load_headers(self):
+        if self._headers is None:
+            headers = {}
+            if os.path.isdir(self._dirname):
+                for fn in sorted(os.listdir(self._dirname)):
+                    if fn.endswith(".json"):
+                        with open(os.path.join(self._dirname, fn), "rb") as f:
+                            header = json.load(f)
+                        headers[header["id"]] = header
+            self._headers = headers
+        return self._headers
+
+    def series(self, track=None, analysis=None, event_type=None):
+        """
+        Return list of index headers for the available series, ordered by
+        series id, optionally selecting just those from analyses whose URI
+        contains a given track identifier, from a given analysis URI, or of a
+        given event type URI.
+        """
+        headers = []
+        for sid, header in sorted(self._load_headers().items()):
+            if track and track not in header["analysis"]:
+                continue
+            if analysis and analysis != header["analysis"]:
+                continue
+            if event_type and event_type != header["event_type"]:
+                continue
+            headers.append(header)
+        return headers
+
+    def header(self, sid):
+        """
+        Return index header for series `sid`.  Raises KeyError if there is no
+        such series.
+        """
+        return self._load_headers()[sid]
+
+    def _map(self, filename):
+        if filename not in self._maps:
+            path = os.path.join(self._dirname, filename)
+            self._maps[filename] = numpy.memmap(path, dtype=numpy.uint8, mode="r")
+        return self._maps[filename]
+
+    def column(self, sid, name):
+        """
+        Return the named column of series `sid` as a read-only array view of
+        the mapped feature file.  Raises KeyError if there is no such column.
+        """
+        if (sid, name) not in self._columns:
+            info   = self.header(sid)["columns"][name]
+            dtype  = numpy.dtype(str(info["dtype"]))
+            shape  = tuple(info["shape"])
+            nbytes = dtype.itemsize * int(numpy.prod(shape))
+            data   = self._map(info["file"])[info["offset"]:info["offset"]+nbytes]
+            # A plain array view of the mapped data is cheaper to slice than a memmap
+            self._columns[(sid, name)] = numpy.asarray(data).view(dtype).reshape(shape)
+        return self._columns[(sid, name)]
+
+    def columns(self, sid):
+        """
+        Return list of names of the event columns for series `sid` (i.e.
+        excluding pyramid summary columns)
+        """
+        return sorted(
+            [ name for name in self.header(sid)["columns"] if not name.startswith("pyramid_") ]
+            )
+
+    def window(self, sid, start=None, end=None, columns=None):
+        """
+        Return dictionary of column views for the events of series `sid` whose
+        times are in the range start <= time < end (either of which may be
+        None for an open range), found by binary search of the time column.
+
+        If `columns` is not supplied, all columns of the series are returned.
+        """
+        times = self.column(sid, "time")
+        lo    = 0 if start is None else times.searchsorted(start, side="left")
+        hi    = len(times) if end is None else times.searchsorted(end, side="left")
+        return dict(
+            [ (name, self.column(sid, name)[lo:hi])
+              for name in (columns or self.columns(sid)) ]
+            )
+
+    def _overlapping_rows(self, sid, start, end):
+        time     = self.column(sid, "time")
+        duration = self.column(sid, "duration")
+        if "max_end" in self.header(sid)["columns"]:
+            max_end = self.column(sid, "max_end")
+        else:
+            max_end = interval_max_end(time, duration)
+        return overlapping_rows(time, duration, max_end, start, end)
+
+    def overlapping(self, sid, start, end, columns=None):
+        """
+        Return dictionary of column values for the events of series `sid` that
+        overlap the time range start..end (see interval_index.overlapping_rows).
+
+        Values are views of the mapped feature file when the matching events
+        are contiguous, as is usual, and otherwise copies of just the rows
+        selected.  If `columns` is not supplied, all columns are returned.
+        """
+        rows = self._overlapping_rows(sid, start, end)
+        return dict(
+            [ (name, self.column(sid, name)[rows])
+              for name in (columns or self.columns(sid)) ]
+            )
+
+    def overlapping_series(self, start, end, columns=None, **selectors):
+        """
+        Return dictionary, keyed by series id, of column values for the events
+        that overlap the time range start..end in each series selected by
+        keyword arguments `track`, `analysis` or `event_type` (see `series`).
+        Series with no overlapping events are omitted, as are any requested
+        columns that a series does not have.
+        """
+        results = {}
+        for header in self.series(**selectors):
+            sid  = header["id"]
+            rows = self._overlapping_rows(sid, start, end)
+            if len(self.column(sid, "time")[rows]):
+                results[sid] = dict(
+                    [ (name, self.column(sid, name)[rows])
+                      for name in (columns or self.columns(sid))
+                      if name in header["columns"] ]
+                    )
+        return results
+
+    def _check_numeric(self, sid):
+        info = self.header(sid)["columns"].get("value", None)
+        if info is None or numpy.dtype(str(info["dtype"])).kind != "f":
+            raise ValueError("Feature series %s has no numeric values to summarize"%sid)
+        return
+
+    def pyramid(self, sid, level, start=None, end=None):
+        """
+        Return dictionary of views of the summary values (see PYRAMID_STATS)
+        at the given level of the pyramid for series `sid`, for the buckets
+        that start before `end` and after the bucket containing `start`
+        (either of which may be None for an open range).
+
+        Level 0 returns the series values themselves, as buckets of one event.
+        Raises ValueError if the series has no numeric values (e.g. a series
+        of labelled chords or segments), or KeyError if it has no such level.
+        """
+        self._check_numeric(sid)
+        if level == 0:
+            events = self.window(sid, start, end, columns=["time", "duration", "value"])
+            value  = events["value"]
+            return (
+                { "time":     events["time"]
+                , "end":      interval_end(events["time"], events["duration"])
+                , "count":    numpy.ones(len(value), dtype=numpy.int32)
+                , "min":      value
+                , "max":      value
+                , "mean":     value
+                })
+        times = self.column(sid, pyramid_column(level, "time"))
+        lo    = 0 if start is None else max(times.searchsorted(start, side="right")-1, 0)
+        hi    = len(times) if end is None else times.searchsorted(end, side="left")
+        return dict(
+            [ (stat, self.column(sid, pyramid_column(level, stat))[lo:hi])
+              for stat in PYRAMID_STATS ]
+            )
+
+    def resolution(self, sid, points, start=None, end=None):
+        """
+        Return (level, summary) for the finest level of the pyramid for series
+        `sid` that has no more than `points` buckets in the range start..end,
+        where summary is as returned by `pyramid`.  If no level has so few
+        buckets, the coarsest level is used.  Raises ValueError if the series
+        has no numeric values.
+        """
+        self._check_numeric(sid)
+        times = self.column(sid, "time")
+        level = 0
+        while True:
+            lo = 0 if start is None else max(times.searchsorted(start, side="right")-1, 0)
+            hi = len(times) if end is None else times.searchsorted(end, side="left")
+            if hi - lo <= points or level >= self.header(sid).get("levels", 0):
+                break
+            level += 1
+            times  = self.column(sid, pyramid_column(level, "time"))
+        return (level, self.pyramid(sid, level, start, end))
+
+    def close(self):
+        """
+        Release mapped files.  Views returned previously remain usable until
+        they are discarded.
+        """
+        self._maps    = {}
+        self._columns = {}
+        return
+
+# End.
@@ -0,0 +1,346 @@
+"""
+Columnar storage of analysis event and feature series as NumPy arrays.
+
+CALMA analyses consist mostly of long series of timeline events (beats, chords,
+segments, frame-level feature values, etc.), each of which would otherwise be
+exported as a separate Annalist entity of string values.  Here, events of a
+given type from a given analysis are gathered into a `feature_series`, whose
+times, durations, values, labels and subject URIs are held as typed NumPy
+arrays in time order.  These are saved as binary array files alongside the
+Annalist collection, and just a summary entity for each series is exported
+(see calma_data.export_feature_series).
+
+An event is recognized by an event:time property whose value is a timeline
+instant or interval with a tl:at time.  A type is packed as a series only if
+all of its subjects are such events, and if they and their time nodes use no
+properties other than those held in the series columns (see SERIES_PREDICATES
+and TIME_PREDICATES), each with a single value, so that no data is lost by
+packing them.  Feature values are read from af:value or, for dense frame-level
+features, af:feature; an event with both is not packed.
+
+Two file formats are supported (see FEATURE_FORMATS):
+
+    npz     one uncompressed .npz archive per series, holding all columns.
+    npy     a directory per series, holding a .npy file for each column.
+
+NumPy is an optional dependency, needed only when a feature store is used.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import re
+import io
+import json
+import zipfile
+import urlparse
+import collections
+import logging
+
+try:
+    import numpy
+    from interval_index  import interval_max_end
+    from feature_pyramid import pyramid_columns, pyramid_column
+except ImportError:
+    numpy = None
+
+from rdflib import Namespace, URIRef
+from rdflib.namespace import RDF, RDFS
+
+log = logging.getLogger(__name__)
+
+EVENT = Namespace("http://purl.org/NET/c4dm/event.owl#")
+TL    = Namespace("http://purl.org/NET/c4dm/timeline.owl#")
+AF    = Namespace("http://purl.org/ontology/af/")
+CALMA = Namespace("http://calma.linkedmusic.org/vocab/")
+
+FEATURE_FORMATS = ("npz", "npy")
+
+FEATURE_DIR     = "features"    # Directory for feature files, within collection
+
+NPZ_DATE_TIME   = (1980, 1, 1, 0, 0, 0)
+
+# Properties of events whose values are held in the series columns
+SERIES_PREDICATES = frozenset([EVENT.time, AF.value, AF.feature, RDFS.label])
+
+# Properties (other than rdf:type) of event time nodes whose values are held
+# in the series columns
+TIME_PREDICATES   = frozenset([TL.at, TL.duration])
+
+DURATION_PATTERN = re.compile(
+    r"^(-)?P(?:(\d+(?:\.\d*)?)D)?"
+    r"(?:T(?:(\d+(?:\.\d*)?)H)?(?:(\d+(?:\.\d*)?)M)?(?:(\d+(?:\.\d*)?)S)?)?$"
+    )
+
+def duration_seconds(value):
+    """
+    Return time in seconds for an xsd:duration value such as "PT1.5S", or for
+    a plain numeric value, or None if the value is not recognized.
+    """
+    m = DURATION_PATTERN.match(unicode(value).strip())
+    if m:
+        (sign, d, h, mi, s) = m.groups()
+        secs = float(d or 0)*86400 + float(h or 0)*3600 + float(mi or 0)*60 + float(s or 0)
+        return -secs if sign else secs
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def value_array(values):
+    """
+    Return array of feature values from a list of af:value or af:feature
+    strings, one per event.
+
+    Values that are all lists of the same number of space-separated numbers are
+    returned as a float32 array with a row for each event (or a 1-dimensional
+    array if each event has a single value).  Other values are returned as an
+    array of strings.
+    """
+    counts = [ len(v.split()) for v in values ]
+    if counts and min(counts) == max(counts) > 0:
+        flat = numpy.fromstring(u" ".join(values), dtype=numpy.float32, sep=" ")
+        if flat.size == sum(counts):
+            if counts[0] == 1:
+                return flat
+            return flat.reshape(len(values), counts[0])
+    return numpy.array(values, dtype=numpy.unicode_)
+
+class feature_series(object):
+
+    """
+    Series of events of a single type from an analysis, as columns of NumPy
+    arrays in time order.
+
+    source          URI of the analysis document containing the events.
+    event_type      URI of the event type.
+    columns         ordered dictionary of arrays, with a row for each event:
+                    "time" and "duration" are times in seconds (duration is NaN
+                    for events without one), "max_end" is an index for time-range
+                    queries (see interval_index), "value" holds af:value or
+                    af:feature values (see value_array), "label" holds event
+                    labels, and "subject" holds the event URIs.  Columns for
+                    which no events have values are omitted.  Series with numeric values also have columns for a
+                    pyramid of summary values (see feature_pyramid).
+    """
+
+    def __init__(self, source, event_type, columns):
+        self.source     = source
+        self.event_type = event_type
+        self.columns    = columns
+        return
+
+    def count(self):
+        return len(self.columns["time"])
+
+    def start(self):
+        return float(self.columns["time"].min()) if self.count() else None
+
+    def end(self):
+        """
+        Return end time of the last event to finish
+        """
+        if not self.count():
+            return None
+        ends = self.columns["time"] + numpy.nan_to_num(self.columns["duration"])
+        return float(ends.max())
+
+    def dimensions(self):
+        """
+        Return number of feature values per event, or 0 if there are none
+        """
+        value = self.columns.get("value", None)
+        if value is None:
+            return 0
+        return value.shape[1] if value.ndim > 1 else 1
+
+    def levels(self):
+        """
+        Return number of levels in the pyramid of summary values, or 0
+        """
+        n = 0
+        while pyramid_column(n+1, "time") in self.columns:
+            n += 1
+        return n
+
+    def summary(self):
+        """
+        Return dictionary of summary values for the series
+        """
+        return (
+            { "event_type":   unicode(self.event_type)
+            , "analysis":     unicode(self.source)
+            , "count":        self.count()
+            , "start":        self.start()
+            , "end":          self.end()
+            , "dimensions":   self.dimensions()
+            , "levels":       self.levels()
+            })
+
+    def serialize(self, format, sid):
+        """
+        Return list of (filename, data) pairs for the files used to save the
+        series with identifier `sid` in the indicated format (see FEATURE_FORMATS),
+        where filenames are relative to the features directory.
+
+        The last file is an index header for the series, "<sid>.json", which
+        holds its summary values and, for each column, the file, byte offset,
+        data type and shape of the column's array data, so that columns can be
+        mapped into memory without parsing the array files (see feature_reader).
+
+        An .npz file is written here (rather than by numpy.savez) with fixed
+        member timestamps, so that unchanged series produce identical files
+        (see export_manifest).
+        """
+        arrays = []
+        for name, column in self.columns.items():
+            column = numpy.ascontiguousarray(column)
+            buf    = io.BytesIO()
+            numpy.save(buf, column)
+            data   = buf.getvalue()
+            info   = (
+                { "offset":   len(data) - column.nbytes
+                , "dtype":    column.dtype.str
+                , "shape":    list(column.shape)
+                })
+            arrays.append((name, data, info))
+        header = dict(self.summary(), id=sid, format=format, columns={})
+        files  = []
+        if format == "npz":
+            filename = "%s.npz"%sid
+            buf      = io.BytesIO()
+            with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as npz:
+                for name, data, info in arrays:
+                    zinfo  = zipfile.ZipInfo(name+".npy", date_time=NPZ_DATE_TIME)
+                    npz.writestr(zinfo, data)
+                    # Stored member data follows its local file header
+                    offset = ( zinfo.header_offset + zipfile.sizeFileHeader +
+                               len(zinfo.filename) + len(zinfo.extra) )
+                    header["columns"][name] = dict(info, file=filename, offset=offset+info["offset"])
+            files.append((filename, buf.getvalue()))
+        else:
+            for name, data, info in arrays:
+                filename = "%s/%s.npy"%(sid, name)
+                header["columns"][name] = dict(info, file=filename)
+                files.append((filename, data))
+        files.append(("%s.json"%sid, json.dumps(header, indent=2, sort_keys=True)))
+        return files
+
+def subject_document(s):
+    """
+    Return URI of the document containing subject `s` (i.e. without fragment)
+    """
+    return urlparse.urldefrag(unicode(s))[0]
+
+def extract_feature_series(rdf, index):
+    """
+    Find event series in an RDF graph, using the supplied graph index.
+
+    Each property used is read with a single scan of the graph, and events of
+    each series type are grouped by the analysis document that contains them.
+
+    Returns (series, types), where series is a list of feature_series, and types
+    is a list of the types whose subjects are all held in the series (including
+    the types of event time nodes), which need not be exported as entities.
+
+    Types with any event or time node that has more than one value for a
+    property held in the series are not packed.
+    """
+    event_times = {}
+    for s, o in rdf.subject_objects(EVENT.time):
+        event_times.setdefault(s, []).append(o)
+    if not event_times:
+        return ([], [])
+    def is_event(s):
+        if not isinstance(s, URIRef) or len(event_times.get(s, [])) != 1:
+            return False
+        preds = index.predicates(s)
+        return ( preds <= SERIES_PREDICATES and
+                 not (AF.value in preds and AF.feature in preds) and
+                 index.predicates(event_times[s][0]) <= TIME_PREDICATES )
+    candidates = [ t for t in index.types()
+                     if not str(t).startswith(str(RDF)) and
+                        index.subjects(t) and all(map(is_event, index.subjects(t))) ]
+    if not candidates:
+        return ([], [])
+    event_times = dict( (s, nodes[0]) for s, nodes in event_times.items() if len(nodes) == 1 )
+    events   = set( s for t in candidates for s in index.subjects(t) )
+    nodes    = set( event_times[s] for s in events )
+    repeated = set()
+    def property_values(p, subjects):
+        values = {}
+        for s, o in rdf.subject_objects(p):
+            if s in subjects:
+                if s in values:
+                    repeated.add(s)
+                values[s] = o
+        return values
+    durations = {}
+    def seconds(v):
+        # Durations recur (e.g. frame lengths), so are converted just once
+        if v not in durations:
+            durations[v] = duration_seconds(v)
+        return durations[v]
+    at       = dict( (n, seconds(v)) for n, v in property_values(TL.at, nodes).items() )
+    duration = dict( (n, seconds(v)) for n, v in property_values(TL.duration, nodes).items() )
+    values   = property_values(AF.value, events)
+    values.update(property_values(AF.feature, events))
+    labels   = property_values(RDFS.label, events)
+    series   = []
+    types    = []
+    packed   = set()
+    for t in candidates:
+        subjects = index.subjects(t)
+        if any( at.get(event_times[s], None) is None for s in subjects ):
+            continue
+        if any( s in repeated or event_times[s] in repeated for s in subjects ):
+            continue
+        types.append(t)
+        documents = collections.OrderedDict()
+        for s in subjects:
+            documents.setdefault(subject_document(s), []).append(s)
+        for source, subjects in documents.items():
+            series.append(
+                make_feature_series(
+                    source, t, subjects, event_times, at, duration, values, labels
+                    )
+                )
+            packed.update(event_times[s] for s in subjects)
+    # Also omit types of time nodes that belong only to packed events
+    for t in index.types():
+        if t not in types and index.subjects(t) and all( s in packed for s in index.subjects(t) ):
+            types.append(t)
+    log.debug("extract_feature_series: %d series, %d types"%(len(series), len(types)))
+    return (series, types)
+
+def make_feature_series(source, t, subjects, event_times, at, duration, values, labels):
+    """
+    Return a feature_series for events `subjects` of type `t` in document `source`,
+    using dictionaries of property values gathered by extract_feature_series.
+    """
+    times   = numpy.array([ at[event_times[s]] for s in subjects ], dtype=numpy.float64)
+    order   = numpy.argsort(times, kind="mergesort")
+    ordered = [ subjects[i] for i in order ]
+    columns = collections.OrderedDict()
+    columns["time"]     = times[order]
+    columns["duration"] = numpy.array(
+        [ duration.get(event_times[s], None) for s in ordered ], dtype=numpy.float64
+        )
+    columns["max_end"]  = interval_max_end(columns["time"], columns["duration"])
+    if any( s in values for s in ordered ):
+        columns["value"] = value_array([ unicode(values.get(s, u"")) for s in ordered ])
+    if any( s in labels for s in ordered ):
+        columns["label"] = numpy.array(
+            [ unicode(labels.get(s, u"")) for s in ordered ], dtype=numpy.unicode_
+            )
+    columns["subject"] = numpy.array([ unicode(s) for s in ordered ], dtype=numpy.unicode_)
+    if "value" in columns and columns["value"].dtype.kind == "f":
+        columns.update(
+            pyramid_columns(columns["time"], columns["duration"], columns["value"])
+            )
+    return feature_series(source, t, columns)
+
+# End.
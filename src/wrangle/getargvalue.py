@@ -33,6 +33,20 @@ def getargvalue(val, prompt):
             if val[-1] == '\n': val = val[:-1]
     return val
 
+def getargvaluelist(filename):
+    """
+    Read list of values, one per line, from the named file, or from standard
+    input if the filename is None or "-".  Blank lines and lines starting
+    with '#' are ignored.
+    """
+    if not filename or filename == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(filename, "r") as f:
+            lines = f.readlines()
+    vals = [ l.strip() for l in lines ]
+    return [ v for v in vals if v and not v.startswith("#") ]
+
 def getsecret(prompt):
     """
     Prompt and read secret value without echo
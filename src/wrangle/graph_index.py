@@ -0,0 +1,111 @@
+"""
+Type, subject and predicate index over an RDF graph.
+
+The export functions in calma_data repeatedly need the subjects of each type,
+the types of each subject and the predicates used by subjects of each type.
+Computing these with separate graph scans for every type and subject costs
+more than linear time as graphs grow, so this index is built from a single
+pass over the graph and then shared by the export functions.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import collections
+
+from rdflib.namespace import RDF, RDFS
+
+from rdf_collections import member_number
+
+class graph_index(object):
+
+    """
+    Index of RDF types, subjects and predicates, built in a single pass over a graph.
+
+    type_subjects       type -> list of subjects of that type, in graph order
+    subject_types       subject -> set of types of that subject
+    subject_predicates  subject -> set of predicates (other than rdf:type) used
+                        with that subject; container membership properties
+                        (rdf:_1, rdf:_2, etc.) are all recorded as rdfs:member
+    type_predicates     type -> set of predicates used by subjects of that type
+    type_info           type -> type information (see calma_data.get_type_info),
+                        filled in as type information is first requested
+    container_members   container -> list of (member number, member) pairs
+    list_first          collection node -> rdf:first value
+    list_rest           collection node -> rdf:rest value
+    bnode_values        blank node -> JSON value (see rdf_bnodes.bnode_value),
+                        filled in as blank node values are first rendered
+    """
+
+    def __init__(self, rdf):
+        self._rdf               = rdf
+        self.type_subjects      = collections.OrderedDict()
+        self.subject_types      = {}
+        self.subject_predicates = {}
+        self.type_info          = {}
+        self.container_members  = {}
+        self.list_first         = {}
+        self.list_rest          = {}
+        self.bnode_values       = {}
+        for s, p, o in rdf:
+            if p == RDF.type:
+                if s not in self.subject_types:
+                    self.subject_types[s] = set()
+                if o not in self.subject_types[s]:
+                    self.subject_types[s].add(o)
+                    self.type_subjects.setdefault(o, []).append(s)
+            else:
+                n = member_number(p)
+                if n is not None:
+                    self.container_members.setdefault(s, []).append((n, o))
+                    p = RDFS.member
+                elif p == RDF.first:
+                    self.list_first[s] = o
+                elif p == RDF.rest:
+                    self.list_rest[s] = o
+                if s not in self.subject_predicates:
+                    self.subject_predicates[s] = set()
+                self.subject_predicates[s].add(p)
+        self.type_predicates = {}
+        for t, subjects in self.type_subjects.items():
+            preds = set()
+            for s in subjects:
+                preds.update(self.subject_predicates.get(s, ()))
+            self.type_predicates[t] = preds
+        return
+
+    def types(self):
+        """
+        Return sorted list of types used in the graph
+        """
+        return sorted(self.type_subjects)
+
+    def subjects(self, t):
+        """
+        Return list of subjects of type `t`
+        """
+        return self.type_subjects.get(t, [])
+
+    def predicates(self, s):
+        """
+        Return set of predicates (other than rdf:type) used with subject `s`,
+        with rdfs:member in place of any container membership properties
+        """
+        return self.subject_predicates.get(s, set())
+
+    def remove_type(self, t):
+        """
+        Remove type `t` from the index, so that its subjects are not exported
+        as entities of that type (e.g. because their data is exported by
+        other means).
+        """
+        for s in self.type_subjects.pop(t, []):
+            self.subject_types[s].discard(t)
+        self.type_predicates.pop(t, None)
+        self.type_info.pop(t, None)
+        return
+
+# End.
@@ -0,0 +1,202 @@
+"""
+Rules for deriving Annalist entity identifiers and field names from RDF URIs.
+
+Identifier derivation is described declaratively by `id_rule` values, which
+are compiled once when created.  Results that depend only on a URI namespace
+(e.g. an identifier stem taken from the namespace path) or only on a predicate
+(field names and property keys) are memoized in bounded caches, so converting
+a subject costs little more than a dictionary lookup and a format operation.
+
+A rule set (`id_rule_set`) selects the rule to use for a subject based on its
+RDF type, falling back to a default rule.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import re
+import weakref
+import urlparse
+import threading
+import collections
+
+class bounded_cache(object):
+
+    """
+    Dictionary-based memo cache holding at most `maxsize` entries; the
+    least recently added entries are discarded when it is full.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._maxsize = maxsize
+        self._lock    = threading.Lock()
+        self._values  = collections.OrderedDict()
+        return
+
+    def get(self, key, compute):
+        """
+        Return cached value for `key`, or call `compute(key)` to obtain and
+        cache a new value.
+        """
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        value = compute(key)
+        with self._lock:
+            if len(self._values) >= self._maxsize:
+                self._values.popitem(last=False)
+            self._values[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+        return
+
+class id_rule(object):
+
+    """
+    Rule for generating an entity id, label and comment for a subject URI.
+
+    stem_pattern    regular expression matched against the last segment of the
+                    subject URI's namespace path.  If it matches, the first group
+                    is used as the identifier "stem" value; otherwise the whole
+                    segment is used.  If None, the stem is an empty string.
+    id_format       format string for the identifier, using values "stem" and
+                    "name" (the local name of the subject URI).
+    replace         list of (old, new) string replacements applied to the stem
+                    and name before they are used in the identifier.
+    max_length      if not None, identifiers longer than this are shortened by
+                    eliding characters from the middle.
+    label_format, comment_format
+                    format strings for default label and comment values, using
+                    values "prefix", "name", "uri" and "id".
+    """
+
+    def __init__(self,
+            stem_pattern=None, id_format="%(name)s", replace=(), max_length=None,
+            label_format="Resource %(prefix)s:%(name)s",
+            comment_format="Resource %(prefix)s:%(name)s (%(uri)s)"):
+        self._stem_re        = re.compile(stem_pattern) if stem_pattern else None
+        self._id_format      = id_format
+        self._replace        = tuple(replace)
+        self._max_length     = max_length
+        self.label_format    = label_format
+        self.comment_format  = comment_format
+        self._stems          = bounded_cache()
+        return
+
+    def _replaced(self, s):
+        for old, new in self._replace:
+            s = s.replace(old, new)
+        return s
+
+    def _compute_stem(self, namespace):
+        if not self._stem_re:
+            return ""
+        upath = urlparse.urlparse(namespace).path
+        uname = upath.rsplit("/",1)[-1]
+        m = self._stem_re.search(uname)
+        if m:
+            return m.group(1)
+        return self._replaced(uname)
+
+    def stem(self, namespace):
+        """
+        Return identifier stem for namespace (memoized per namespace)
+        """
+        return self._stems.get(unicode(namespace), self._compute_stem)
+
+    def entity_id(self, namespace, name):
+        """
+        Return entity identifier for a subject with given namespace and local name
+        """
+        eid = self._id_format%{ "stem": self.stem(namespace), "name": self._replaced(name) }
+        if self._max_length and len(eid) > self._max_length:
+            eid = eid[0:8]+"___"+eid[-20:]
+        return eid
+
+class id_rule_set(object):
+
+    """
+    Set of identifier rules, selected by RDF type of the subject.
+
+    default         rule used for subjects that do not match a type-specific rule.
+    type_rules      dictionary of rules keyed by type URI.
+    """
+
+    def __init__(self, default, type_rules=None):
+        self._default    = default
+        self._type_rules = dict(type_rules or {})
+        return
+
+    def add_type_rule(self, t, rule):
+        self._type_rules[t] = rule
+        return
+
+    def rule_for_type(self, t):
+        """
+        Return rule to use for subjects of type `t` (which may be None).
+        """
+        return self._type_rules.get(t, self._default)
+
+# Field names and property keys for predicates, memoized in a cache for each
+# namespace manager.  The caches are held by weak references to the namespace
+# managers, so that a cache does not keep its manager (and with it the graph
+# that the manager refers to) alive after the graph has been exported.
+
+_field_keys      = weakref.WeakKeyDictionary()
+_field_keys_lock = threading.Lock()
+
+def _compute_field_key(namespace_manager, p):
+    prefix, namespace, name = namespace_manager.compute_qname(p)
+    pf = "%s_field"%name
+    pk = "%s:%s"%(prefix, name) if prefix else str(p)
+    return (name, pf, pk)
+
+def field_key(namespace_manager, p):
+    """
+    Return (property name, field id, property key) for predicate `p`, using
+    the supplied namespace manager to determine a prefix for the property key.
+    """
+    cache = _field_keys.get(namespace_manager, None)
+    if cache is None:
+        with _field_keys_lock:
+            cache = _field_keys.setdefault(namespace_manager, bounded_cache())
+    return cache.get(p, lambda p: _compute_field_key(namespace_manager, p))
+
+# Rules used for CALMA data
+
+# Generic subjects: identifier is the local name of the subject URI
+SUBJECT_ID_RULES = id_rule_set(id_rule())
+
+# Activities and other analysis data: fold the last part of the namespace URI
+# path (or a 12-character identifier at the end of it) into the identifier.
+ACTIVITY_ID_RULES = id_rule_set(
+    id_rule(
+        stem_pattern="-([a-z0-9]{12})$",
+        id_format="%(stem)s_%(name)s",
+        replace=(("-", "_"),),
+        max_length=32,
+        comment_format="Resource %(prefix)s:%(name)s (%(uri)s), id %(id)s"
+        )
+    )
+
+# Feature series (see calma_data.export_feature_series): fold the analysis
+# document name (or a 12-character identifier at the end of it) into the
+# identifier, without shortening, so that series from different analyses of
+# a track have distinct identifiers.
+FEATURE_SERIES_ID_RULES = id_rule_set(
+    id_rule(
+        stem_pattern=r"([a-z0-9]{12})(?:\.\w+)?$",
+        id_format="%(stem)s_%(name)s",
+        replace=(("-", "_"), (".", "_")),
+        comment_format="Series of %(name)s events from %(uri)s, id %(id)s"
+        )
+    )
+
+# End.
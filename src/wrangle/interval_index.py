@@ -0,0 +1,69 @@
+"""
+Sorted-array interval index for time-range queries over analysis events.
+
+Events of a feature series (see feature_store) are held in order of start time,
+with a duration for each (NaN or 0 for instantaneous events).  The index adds
+one further array, `max_end`: for each event, the latest end time of that
+event and all events before it.  As both start times and `max_end` are sorted,
+the events that may overlap a time range are found by two binary searches:
+
+    - events starting at or after the end of the range cannot overlap it, and
+    - events up to the last one whose `max_end` is at or before the start of
+      the range cannot overlap it (unless they are instants within the range).
+
+The events between are then checked with a single vectorized comparison.  For
+series of non-overlapping or briefly overlapping events (beats, chords, notes,
+segments, frames) this range contains just the events that overlap the query,
+so a query costs O(log n) plus the number of events returned.
+
+Usage:
+
+    max_end = interval_max_end(time, duration)
+    rows    = overlapping_rows(time, duration, max_end, t1, t2)
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+import numpy
+
+def interval_end(time, duration):
+    """
+    Return array of event end times, treating events without a duration as
+    instantaneous.
+    """
+    return time + numpy.nan_to_num(duration)
+
+def interval_max_end(time, duration):
+    """
+    Return index array of the running maximum end time for events in order of
+    start time.
+    """
+    return numpy.maximum.accumulate(interval_end(time, duration))
+
+def overlapping_rows(time, duration, max_end, start, end):
+    """
+    Return the rows of events that overlap the time range start..end, as a
+    slice if they are contiguous (so that column views need not be copied),
+    or otherwise as an array of row numbers.
+
+    An event overlaps the range if it starts before `end` and finishes after
+    `start`; instantaneous events overlap if start <= time < end.
+    """
+    hi = time.searchsorted(end, side="left")
+    lo = min(
+        max_end.searchsorted(start, side="right"),
+        time.searchsorted(start, side="left")
+        )
+    if lo >= hi:
+        return slice(lo, lo)
+    t    = time[lo:hi]
+    mask = (interval_end(t, duration[lo:hi]) > start) | (t >= start)
+    if mask.all():
+        return slice(lo, hi)
+    return lo + numpy.flatnonzero(mask)
+
+# End.
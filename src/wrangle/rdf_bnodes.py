@@ -0,0 +1,89 @@
+"""
+Rendering of blank node values as nested JSON, for export.
+
+A blank node value is rendered using its concise bounded description: the
+properties of the blank node, with the values of any further blank nodes
+rendered in the same way, so that a structure such as an event's timeline
+interval appears in the exported entity rather than as an opaque node label.
+RDF containers and collections are rendered as lists of their members (see
+rdf_collections).
+
+CALMA timeline structures nest blank nodes deeply, and blank nodes may be
+shared by several subjects, so the description of each blank node is built
+just once, using an explicit stack rather than recursion, and memoized (in
+the graph index, if one is supplied) for reuse wherever the node appears.
+A blank node that refers back to a node whose description is still being
+built (i.e. a cycle) is rendered as its node label.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+from rdflib import BNode
+
+from id_rules        import field_key
+from rdf_collections import collection_members, member_number
+
+def bnode_value(rdf, node, index=None, memo=None):
+    """
+    Return JSON value for blank node `node`: a list of member values for an
+    RDF container or collection, or otherwise a dictionary keyed by property
+    key (see id_rules.field_key), in which properties with several values
+    have a list of values.
+
+    Descriptions are memoized in `memo` if supplied, otherwise in the graph
+    index if supplied.
+    """
+    if memo is None:
+        memo = index.bnode_values if index is not None else {}
+    if node in memo:
+        return memo[node]
+    nsm    = rdf.namespace_manager
+    active = set()              # Nodes whose descriptions are being built
+    stack  = [(node, None, None)]
+    def value(o):
+        if isinstance(o, BNode):
+            # A node not yet described here is on a cycle
+            return memo.get(o, str(o))
+        return str(o)
+    while stack:
+        n, members, entries = stack[-1]
+        if members is None and entries is None:
+            # First visit: find the node's values, and describe any blank
+            # node values before the node itself
+            if n in memo or n in active:
+                stack.pop()
+                continue
+            members = collection_members(rdf, n, index=index)
+            if members is None:
+                entries = [ (p, o) for p, o in rdf.predicate_objects(n)
+                                   if member_number(p) is None ]
+            stack[-1] = (n, members, entries)
+            active.add(n)
+            for o in reversed(members if members is not None else [ o for p, o in entries ]):
+                if isinstance(o, BNode) and o not in memo and o not in active:
+                    stack.append((o, None, None))
+            continue
+        stack.pop()
+        active.discard(n)
+        if members is not None:
+            memo[n] = [ value(m) for m in members ]
+            continue
+        nd       = {}
+        multiple = set()
+        for p, o in entries:
+            pn, pf, pk = field_key(nsm, p)
+            if pk in multiple:
+                nd[pk].append(value(o))
+            elif pk in nd:
+                nd[pk] = [nd[pk], value(o)]
+                multiple.add(pk)
+            else:
+                nd[pk] = value(o)
+        memo[n] = nd
+    return memo[node]
+
+# End.
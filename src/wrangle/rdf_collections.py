@@ -0,0 +1,123 @@
+"""
+Decoding of RDF containers (rdf:Seq, rdf:Bag, rdf:Alt) and collections
+(rdf:List) to lists of members, for export as JSON lists.
+
+CALMA analyses use containers for long sequences of events (e.g. segments and
+beats), so members are gathered from a single scan of each container's
+properties, or from a `graph_index` built in a single pass over the graph, and
+ordered numerically in linear time, rather than by looking up each membership
+property in turn.
+"""
+
+from __future__ import print_function
+
+__author__      = "Graham Klyne (GK@ACM.ORG)"
+__copyright__   = "Copyright 2015, G. Klyne"
+__license__     = "MIT (http://opensource.org/licenses/MIT)"
+
+from rdflib.namespace import RDF
+
+RDF_MEMBER_PREFIX = unicode(RDF) + u"_"
+
+CONTAINER_TYPES   = frozenset([RDF.Seq, RDF.Bag, RDF.Alt])
+
+def member_number(p):
+    """
+    Return the member number for a container membership property rdf:_N,
+    or None if the supplied predicate is not a membership property.
+    """
+    if p.startswith(RDF_MEMBER_PREFIX):
+        n = p[len(RDF_MEMBER_PREFIX):]
+        if n.isdigit():
+            return int(n)
+    return None
+
+def ordered_members(numbered):
+    """
+    Return members from a list of (number, member) pairs, in numeric order.
+
+    Membership properties are normally numbered 1..n, so members are placed
+    directly by number in linear time.  Sparse or repeated numbering falls back
+    to sorting.
+    """
+    count = len(numbered)
+    if count == 0:
+        return []
+    slots = [None] * (2*count+1)
+    for n, m in numbered:
+        if n >= len(slots) or slots[n] is not None:
+            return [ m for (n, m) in sorted(numbered) ]
+        slots[n] = (m,)
+    return [ slot[0] for slot in slots if slot is not None ]
+
+def container_members(rdf, c, index=None):
+    """
+    Return list of members of container `c` in numeric order, or None if `c`
+    is not a container.
+
+    If a graph index is supplied, it is used in place of a scan of the graph.
+    """
+    if index is not None:
+        numbered = index.container_members.get(c, None)
+        if numbered is None:
+            if CONTAINER_TYPES & index.subject_types.get(c, frozenset()):
+                return []
+            return None
+        return ordered_members(numbered)
+    numbered  = []
+    container = False
+    for p, o in rdf.predicate_objects(c):
+        n = member_number(p)
+        if n is not None:
+            numbered.append((n, o))
+        elif p == RDF.type and o in CONTAINER_TYPES:
+            container = True
+    if not (numbered or container):
+        return None
+    return ordered_members(numbered)
+
+def list_members(rdf, l, index=None):
+    """
+    Return list of members of RDF collection `l`, or None if `l` is not a
+    collection.  A collection with a missing rdf:rest or a cycle is truncated.
+
+    If a graph index is supplied, it is used in place of lookups in the graph.
+    """
+    if l == RDF.nil:
+        return []
+    if index is not None:
+        first, rest = index.list_first, index.list_rest
+        if l not in first:
+            return None
+    else:
+        first, rest = {}, {}
+        node = l
+        while node is not None and node != RDF.nil and node not in first:
+            for p, o in rdf.predicate_objects(node):
+                if p == RDF.first:
+                    first[node] = o
+                elif p == RDF.rest:
+                    rest[node] = o
+            node = rest.get(node, None)
+        if l not in first:
+            return None
+    members = []
+    seen    = set()
+    node    = l
+    while node in first and node not in seen:
+        seen.add(node)
+        members.append(first[node])
+        node = rest.get(node, None)
+    return members
+
+def collection_members(rdf, node, index=None):
+    """
+    Return list of members of an RDF container or collection, or None if the
+    supplied node is neither.
+    """
+    members = container_members(rdf, node, index=index)
+    if members is None:
+        members = list_members(rdf, node, index=index)
+    return members
+
+# End.
@@ -27,10 +27,12 @@ sys.path.insert(0, srcroot)
 
 from wrangle_errors import wrangle_errors, wrangle_unexpected, wrangle_report
 from calma_data     import (
+    configure_http, configure_rdf, report_http, begin_export, end_export,
     explore_analysis, 
     export_analysis, export_annalist_metadata, export_annalist_subjects,
-    export_analyses_multiple
+    export_analyses_multiple, export_batch, explode_bundle
     )
+from feature_store  import FEATURE_FORMATS
 
 VERSION = "0.1.1"
 
@@ -40,10 +42,20 @@ command_summary_help = ("\n"+
     "  %(prog)s explore_analysis URL\n"+
     "  %(prog)s export_metadata URL\n"+
     "  %(prog)s export_subjects URL\n"+
-    "  %(prog)s export_multiple_analyses URL\n"+
+    "  %(prog)s [--jobs N | --stream | --processes N] export_multiple_analyses URL\n"+
+    "  %(prog)s --journal FILE [--processes N] export_multiple_analyses URL\n"+
+    "  %(prog)s [--jobs N] [--per-host N] [--journal FILE] export_batch [FILE]\n"+
     "  %(prog)s export_all URL\n"+
+    "  %(prog)s [--bundle FILE] export_analysis URL\n"+
+    "  %(prog)s --feature-store npz|npy export_analysis URL\n"+
+    "  %(prog)s explode_bundle FILE\n"+
     "  %(prog)s help [command]\n"+
     "  %(prog)s version\n"+
+    "\n"+
+    "A URL may also be the name of a local file or directory: a directory is\n"+
+    "searched for analyses.ttl and analysis_*.ttl files, which are used in place\n"+
+    "of the corresponding remote resources.  Local files may be compressed, with\n"+
+    "names like analysis_*.ttl.gz or analysis_*.ttl.bz2.\n"+
     "")
 
 def progname(args):
@@ -110,6 +122,137 @@ def parseCommandArgs(argv):
                         dest="debug", 
                         default=False,
                         help="Run with full debug output enabled")
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        dest="jobs", metavar="N",
+                        default=1,
+                        help="Number of analyses to fetch and parse concurrently.")
+    parser.add_argument("--per-host",
+                        type=int,
+                        dest="per_host", metavar="N",
+                        default=2,
+                        help="With --jobs, maximum number of analyses fetched concurrently "+
+                             "from any one host by export_batch and journalled exports "+
+                             "(default: %(default)s).")
+    parser.add_argument("--async-fetch",
+                        action="store_true",
+                        dest="async_fetch",
+                        default=False,
+                        help="Fetch analyses using a single-threaded event-driven fetcher, "+
+                             "with up to --jobs connections per host.")
+    parser.add_argument("--stream",
+                        action="store_true",
+                        dest="stream",
+                        default=False,
+                        help="Export each analysis as it is read, rather than merging "+
+                             "all analyses into a single graph before export.")
+    parser.add_argument("-p", "--processes",
+                        type=int,
+                        dest="processes", metavar="N",
+                        default=1,
+                        help="Number of worker processes used to export data.")
+    parser.add_argument("--partition",
+                        dest="partition",
+                        choices=["analysis", "type"],
+                        default="analysis",
+                        help="How export work is divided between worker processes "+
+                             "for export_multiple_analyses: by analysis or by RDF type "+
+                             "(default: %(default)s).")
+    parser.add_argument("--incremental",
+                        action="store_true",
+                        dest="incremental",
+                        default=False,
+                        help="Only write exported files whose content has changed since "+
+                             "the last export, and report files from earlier exports "+
+                             "that are no longer produced.")
+    parser.add_argument("--prune",
+                        action="store_true",
+                        dest="prune",
+                        default=False,
+                        help="With incremental export, remove files from earlier exports "+
+                             "that are no longer produced.")
+    parser.add_argument("--journal",
+                        dest="journal", metavar="FILE",
+                        default=None,
+                        help="Record progress of export_multiple_analyses in a journal file, "+
+                             "and skip analyses that the journal records as already exported.  "+
+                             "Analyses are exported individually, as with --stream or "+
+                             "--partition analysis.")
+    parser.add_argument("--retries",
+                        type=int,
+                        dest="retries", metavar="N",
+                        default=3,
+                        help="With --journal or export_batch, number of times analyses that "+
+                             "cannot be read or exported are retried (default: %(default)s).")
+    parser.add_argument("--retry-delay",
+                        type=float,
+                        dest="retry_delay", metavar="SECONDS",
+                        default=5.0,
+                        help="Delay before retrying failed analyses, doubled "+
+                             "for each retry (default: %(default)s).")
+    parser.add_argument("--writers",
+                        type=int,
+                        dest="writers", metavar="N",
+                        default=0,
+                        help="Number of background threads used to write exported files "+
+                             "(default: write files synchronously).")
+    parser.add_argument("--bundle",
+                        dest="bundle", metavar="FILE",
+                        default=None,
+                        help="Write exported data to a single bundle file rather than "+
+                             "to the Annalist collection directory.  The bundle is an "+
+                             "uncompressed tar archive if FILE ends with '.tar', "+
+                             "otherwise JSON lines.  Use explode_bundle to unpack it.")
+    parser.add_argument("--shard-fanout",
+                        type=int,
+                        dest="shard_fanout", metavar="N",
+                        default=0,
+                        help="Export entities to N hash-selected shard directories within "+
+                             "each type directory, rather than directly in the type directory.")
+    parser.add_argument("--shard-type",
+                        action="append",
+                        dest="shard_types", metavar="TYPE_ID",
+                        default=None,
+                        help="Type id to which the sharded layout is applied (may be repeated; "+
+                             "default: all types).")
+    parser.add_argument("--pool-size",
+                        type=int,
+                        dest="pool_size", metavar="N",
+                        default=None,
+                        help="Number of idle keep-alive HTTP connections retained per host.")
+    parser.add_argument("--pool-idle-timeout",
+                        type=float,
+                        dest="pool_idle_timeout", metavar="SECONDS",
+                        default=None,
+                        help="Time for which an idle HTTP connection is retained for reuse.")
+    parser.add_argument("--cache-dir",
+                        dest="cache_dir", metavar="DIR",
+                        default=None,
+                        help="Directory for caching HTTP responses and parsed RDF between runs.  "+
+                             "Cached responses are revalidated using conditional requests.")
+    parser.add_argument("--cache-max-age",
+                        type=float,
+                        dest="cache_max_age", metavar="SECONDS",
+                        default=0,
+                        help="Age up to which cached responses are used without revalidation.")
+    parser.add_argument("--no-graph-cache",
+                        action="store_true",
+                        dest="no_graph_cache",
+                        default=False,
+                        help="Do not cache parsed RDF in the --cache-dir directory.")
+    parser.add_argument("--compact-store",
+                        action="store_true",
+                        dest="compact_store",
+                        default=False,
+                        help="Hold RDF data read in a compact triple store, which uses "+
+                             "much less memory than the default store for large graphs.")
+    parser.add_argument("--feature-store",
+                        choices=FEATURE_FORMATS,
+                        dest="feature_store", metavar="FORMAT",
+                        default=None,
+                        help="Save event and feature series from analyses as NumPy arrays "+
+                             "in the collection's features directory, in FORMAT 'npz' or 'npy', "+
+                             "and export just a summary entity for each series.  Requires NumPy.")
     parser.add_argument("command", metavar="COMMAND",
                         nargs=None,
                         help="sub-command, one of the options listed below."
@@ -128,6 +271,15 @@ def parseCommandArgs(argv):
     return None
 
 def run(userhome, userconfig, options, progname):
+    configure_http(options)
+    configure_rdf(options)
+    status = begin_export(options)
+    if status != wrangle_errors.SUCCESS:
+        return status
+    status = run_command(userhome, userconfig, options, progname)
+    return end_export(options, status)
+
+def run_command(userhome, userconfig, options, progname):
     # if options.command.startswith("runt"):                  # runtests
     #     return am_runtests(srcroot, options)
     # if options.command.startswith("init"):                  # initialize
@@ -140,8 +292,12 @@ def run(userhome, userconfig, options, progname):
         return export_annalist_subjects(srcroot, userhome, userconfig, options)
     if options.command.startswith("export_mul"):
         return export_analyses_multiple(srcroot, userhome, userconfig, options)
+    if options.command.startswith("export_bat"):
+        return export_batch(srcroot, userhome, userconfig, options)
     if options.command.startswith("export_ana"):
         return export_analysis(srcroot, userhome, userconfig, options)
+    if options.command.startswith("explode"):
+        return explode_bundle(srcroot, userhome, userconfig, options)
     if options.command.startswith("ver"):                   # version
         return wrangle_version(srcroot, userhome, options)
     if options.command.startswith("help"):
@@ -171,6 +327,7 @@ def runCommand(userhome, userconfig, argv):
     if options:
         progname = os.path.basename(argv[0])
         status   = run(userhome, userconfig, options, progname)
+        report_http()
     else:
         status = wrangle_errors.BADCMD
     return status
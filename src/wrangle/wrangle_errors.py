@@ -28,6 +28,9 @@ class wrangle_errors(object):
     UNEXPECTEDARGS  = 8     # Unexpected arguments supplied
     HTTPFAIL        = 9     # HTTP error
     UNKNOWNCMD      = 11    # Unknown command name for help
+    WRITEFAIL       = 12    # Error writing exported data
+    BADBUNDLE       = 13    # Invalid export bundle file
+    EXPORTFAIL      = 14    # Error reading or exporting analysis data
 
 def wrangle_report(status, message):
     print(message, file=sys.stderr)